@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+""" Micro-benchmark of parsing the Barcode_lane_statistics of one flowcell
+document with many rows, e.g.
+
+    python -m benchmarks.flowcell_parser --rows 100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import random
+import time
+
+from benchmarks import synthetic
+from ngi_reports.utils import flowcell_parsers
+
+PROJECT = synthetic.PROJECT_NAME
+
+def synthetic_flowcell(rows, db='x_flowcells', lanes=4, other_projects=4, seed=1):
+    """Return the flowcell info and a document with the given number of lane
+    statistics rows, spread evenly over this and the other projects
+
+    :param int rows: number of rows in Barcode_lane_statistics
+    :param str db: database of the flowcell, which decides the statistics keys
+    """
+    rnd = random.Random(seed)
+    projects = [PROJECT, PROJECT.replace('.', '__')] + ['B.Other_{}'.format(k) for k in range(other_projects)]
+    stats = [synthetic.stat_row(db, projects[i % len(projects)], 1 + i % lanes, 'P1000_{}'.format(i // lanes % 5000),
+                                'ACGT{:05d}'.format(i // lanes), rnd)
+             for i in range(rows)]
+    fc_details = synthetic.flowcell_document('flowcell_0', '200101_H0001BCXX', 'NovaSeq6000', stats, lanes)
+    fc = {'name': 'H0001BCXX', 'run_name': '200101_H0001BCXX', 'date': '200101', 'db': db}
+    return fc, fc_details
+
+def main():
+    parser = argparse.ArgumentParser(description="Time parsing one flowcell document with many lane statistics rows")
+    parser.add_argument('--rows', default=100000, type=int, help="Number of Barcode_lane_statistics rows")
+    parser.add_argument('--db', default='x_flowcells', choices=['flowcells', 'x_flowcells'], help="Database of the flowcell")
+    parser.add_argument('--repeat', default=5, type=int, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    log = logging.getLogger('benchmark')
+    log.addHandler(logging.NullHandler())
+    fc, fc_details = synthetic_flowcell(args.rows, db=args.db)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        fcObj, sample_qval = flowcell_parsers.parse_flowcell(log, fc, fc_details, PROJECT)
+        timings.append(time.perf_counter() - start)
+    print('{} rows, {} records of this project in {} lanes: best {:.3f}s, {:.2f}us per row'.format(
+          args.rows, len(sample_qval), len(fcObj.lanes), min(timings), min(timings) / args.rows * 1e6))
+
+if __name__ == "__main__":
+    main()
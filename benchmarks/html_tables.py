@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+""" Benchmark of the HTML report with the large tables as static HTML, as by
+default, and embedded as JSON, as with `--json_tables`, on synthetic projects of
+several sizes: the size of the HTML file, the time to write it, the number of
+table rows in the page once loaded and, if a Chrome or Chromium browser is found
+or given, the time to first render it, e.g.
+
+    python -m benchmarks.html_tables --samples 1000 10000 50000 --browser chromium
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from benchmarks import synthetic
+from benchmarks.report import ORGANISM_NAMES, REPORTS_DIR, best_time
+from ngi_reports.ngi_reports import get_jinja2_env, markdown_to_html
+from ngi_reports.reports import project_summary
+from ngi_reports.utils.entities import Project
+
+MODES = ('html', 'json')
+PAGE_SIZE_PAT = re.compile(r'var JSON_TABLE_PAGE_SIZE = (\d+);')
+TABLE_DATA_PAT = re.compile(r'<script type="application/json" class="table_data">(.*?)</script>')
+SCRIPT_PAT = re.compile(r'<script.*?</script>', re.S)
+BROWSERS = ('chromium', 'chromium-browser', 'google-chrome', 'google-chrome-stable')
+
+def find_browser(browser=None):
+    """Return the path of the given browser, or of the first Chrome or Chromium found, None if there is none"""
+    for name in [browser] if browser else BROWSERS:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def loaded_rows(html_path):
+    """Return the number of table rows in the page once loaded, the rows of
+    the tables embedded as JSON only count up to the page size
+    """
+    with open(html_path) as f:
+        html = f.read()
+    page_size = PAGE_SIZE_PAT.search(html)
+    rows = SCRIPT_PAT.sub('', html).count('<tr>')
+    for data in TABLE_DATA_PAT.findall(html):
+        rows += max(1, min(int(page_size.group(1)), len(json.loads(data)['rows'])))
+    return rows
+
+def render_seconds(browser, html_path, repeat):
+    """Return the best wall time of a headless browser loading the file and
+    running its scripts, less the time it takes for an empty page
+    """
+    def load(path):
+        subprocess.run([browser, '--headless', '--disable-gpu', '--no-sandbox', '--dump-dom', 'file://' + path],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    empty_path = os.path.join(os.path.dirname(html_path), 'empty.html')
+    with open(empty_path, 'w') as f:
+        f.write('<!DOCTYPE html><html><body></body></html>')
+    return best_time(lambda: load(html_path), repeat)[1] - best_time(lambda: load(empty_path), repeat)[1]
+
+def run_scale(samples, args, work_dir, browser, log):
+    """Write the HTML report of a synthetic project with the given number of
+    samples in each mode, return a dict of mode -> size in KB, write seconds,
+    loaded rows and render seconds
+    """
+    fixtures = os.path.join(work_dir, 'statusdb_{}.sqlite'.format(samples))
+    synthetic.write_fixtures(synthetic.synthetic_statusdb(samples, preps=args.preps, flowcells=args.flowcells, lanes=args.lanes), fixtures)
+    options = {'project': synthetic.PROJECT_ID, 'replay_statusdb': fixtures, 'no_project_cache': True,
+               'exclude_fc': [], 'signature': 'Benchmark'}
+    proj = Project()
+    proj.populate(log, ORGANISM_NAMES, **options)
+    template = get_jinja2_env(REPORTS_DIR).get_template('project_summary.md')
+
+    results = {}
+    for mode in MODES:
+        report = project_summary.Report(log, work_dir, json_tables=mode == 'json', **options)
+        output_mds = report.generate_report_template(proj, template, 'support@example.com')
+        output_bn, output_md = list(output_mds.items())[0]
+        html_md, table_bodies = report.html_outputs.get(output_bn, (output_md, None))
+        out_path = os.path.join(work_dir, 'report_{}_{}.html'.format(samples, mode))
+        _, write_seconds = best_time(
+            lambda: markdown_to_html('project_summary', markdown_text=html_md, reports_dir=REPORTS_DIR, out_path=out_path,
+                                     table_bodies=table_bodies, json_tables=mode == 'json'), args.repeat)
+        results[mode] = {'size_kb': os.path.getsize(out_path) / 1024.0, 'write_seconds': write_seconds, 'loaded_rows': loaded_rows(out_path),
+                         'render_seconds': render_seconds(browser, out_path, args.repeat) if browser else None}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the HTML report with static and JSON embedded tables on synthetic projects")
+    parser.add_argument('--samples', default=[100, 1000, 10000], nargs='+', type=int, help="Numbers of samples of the projects to benchmark")
+    parser.add_argument('--preps', default=1, type=int, help="Number of library preps per sample")
+    parser.add_argument('--flowcells', default=4, type=int, help="Number of flowcells the project was sequenced on")
+    parser.add_argument('--lanes', default=4, type=int, help="Number of lanes per flowcell")
+    parser.add_argument('--browser', default=None, help="Chrome or Chromium executable to time the first render with, looked up if not given")
+    parser.add_argument('--repeat', default=3, type=int, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    log = logging.getLogger('benchmark')
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+
+    browser = find_browser(args.browser)
+    if not browser:
+        print('No Chrome or Chromium browser found, not timing the first render')
+    work_dir = tempfile.mkdtemp(prefix='ngi_reports_benchmark_')
+    try:
+        print('{:>8} {:>5} {:>12} {:>10} {:>12} {:>10}'.format('samples', 'mode', 'size KB', 'write s', 'loaded rows', 'render s'))
+        for samples in args.samples:
+            results = run_scale(samples, args, work_dir, browser, log)
+            for mode in MODES:
+                render = results[mode]['render_seconds']
+                print('{:>8} {:>5} {:>12.1f} {:>10.4f} {:>12} {:>10}'.format(
+                    samples, mode, results[mode]['size_kb'], results[mode]['write_seconds'], results[mode]['loaded_rows'],
+                    '-' if render is None else '{:.4f}'.format(render)))
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+""" Benchmark of the hot paths of a 'project_summary' report on synthetic projects
+of several sizes, replayed from a fixture store so no StatusDB is needed, e.g.
+
+    python -m benchmarks.report --samples 10 1000 10000 --save before.json
+    python -m benchmarks.report --samples 10 1000 10000 --compare before.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import jinja2
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks import synthetic
+from ngi_reports.ngi_reports import markdown_to_html
+from ngi_reports.reports import project_summary
+from ngi_reports.utils.entities import Project
+
+REPORTS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'report_templates'))
+ORGANISM_NAMES = {'hg38': 'Homo sapiens'}
+PHASES = ('populate', 'generate_report_template', 'create_table_text', 'markdown_to_html')
+
+def best_time(func, repeat):
+    """Return the result of the last call and the best wall time of calling func repeat times"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+def run_scale(samples, args, work_dir, log):
+    """Generate a synthetic project with the given number of samples and time
+    each phase of its report, return a dict of phase -> best seconds
+    """
+    fixtures = os.path.join(work_dir, 'statusdb_{}.sqlite'.format(samples))
+    synthetic.write_fixtures(synthetic.synthetic_statusdb(samples, preps=args.preps, flowcells=args.flowcells, lanes=args.lanes,
+                                                          instruments=args.instruments, other_projects=args.other_projects),
+                             fixtures)
+    options = {'project': synthetic.PROJECT_ID, 'replay_statusdb': fixtures, 'no_project_cache': True,
+               'exclude_fc': [], 'signature': 'Benchmark', 'markdown_tables': args.markdown_tables}
+    timings = {}
+
+    def populate():
+        proj = Project()
+        proj.populate(log, ORGANISM_NAMES, **options)
+        return proj
+    proj, timings['populate'] = best_time(populate, args.repeat)
+
+    report = project_summary.Report(log, work_dir, **options)
+    template = jinja2.Environment(loader=jinja2.FileSystemLoader(REPORTS_DIR)).get_template('project_summary.md')
+    output_mds, timings['generate_report_template'] = best_time(
+        lambda: report.generate_report_template(proj, template, 'support@example.com'), args.repeat)
+
+    sample_rows = [s.to_row() for s in proj.samples.values()]
+    _, timings['create_table_text'] = best_time(
+        lambda: report.create_table_text(sample_rows, filter_keys=['ngi_id', 'customer_name', 'total_reads', 'qscore'],
+                                         header=['NGI ID', 'User ID', proj.samples_unit, '>=Q30']), args.repeat)
+
+    # converted like make_reports does, with the tables rendered to HTML directly unless --markdown_tables
+    output_bn, output_md = list(output_mds.items())[0]
+    html_md, table_bodies = report.html_outputs.get(output_bn, (output_md, None))
+    out_path = os.path.join(work_dir, 'report_{}.html'.format(samples))
+    _, timings['markdown_to_html'] = best_time(
+        lambda: markdown_to_html('project_summary', markdown_text=html_md, reports_dir=REPORTS_DIR, out_path=out_path,
+                                 table_bodies=table_bodies), args.repeat)
+    return timings
+
+def compare(results, baseline, tolerance):
+    """Print the phases that got slower than the baseline by more than the
+    tolerance, return True if there are any
+    """
+    regressions = False
+    for scale, timings in results.items():
+        for phase, seconds in timings.items():
+            before = baseline.get(scale, {}).get(phase)
+            if before and seconds > before * (1 + tolerance):
+                print('REGRESSION {} samples {}: {:.4f}s, was {:.4f}s (+{:.0%})'.format(scale, phase, seconds, before, seconds / before - 1))
+                regressions = True
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the report hot paths on synthetic projects of several sizes")
+    parser.add_argument('--samples', default=[10, 1000, 10000], nargs='+', type=int, help="Numbers of samples of the projects to benchmark")
+    parser.add_argument('--preps', default=1, type=int, help="Number of library preps per sample")
+    parser.add_argument('--flowcells', default=4, type=int, help="Number of flowcells the project was sequenced on")
+    parser.add_argument('--lanes', default=4, type=int, help="Number of lanes per flowcell")
+    parser.add_argument('--instruments', default=['NovaSeq6000', 'HiSeqX', 'HiSeq2500', 'NextSeq2000'], nargs='+',
+                        choices=sorted(synthetic.INSTRUMENTS), help="Flowcell types, used in turn for the flowcells")
+    parser.add_argument('--other_projects', default=2, type=int, help="Number of other projects in each lane")
+    parser.add_argument('--markdown_tables', action='store_true', help="Convert the large tables to HTML through markdown, as with the report option")
+    parser.add_argument('--repeat', default=3, type=int, help="Number of timed runs of each phase, the best one is reported")
+    parser.add_argument('--save', default=None, help="Write the timings to this JSON file")
+    parser.add_argument('--compare', default=None, help="Compare the timings to the ones saved in this JSON file, exit 1 on regressions")
+    parser.add_argument('--tolerance', default=0.25, type=float, help="Slowdown allowed before a phase is a regression, as a fraction")
+    args = parser.parse_args()
+
+    log = logging.getLogger('benchmark')
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+
+    work_dir = tempfile.mkdtemp(prefix='ngi_reports_benchmark_')
+    results = {}
+    try:
+        print('{:>8} {}'.format('samples', ' '.join('{:>25}'.format(phase) for phase in PHASES)))
+        for samples in args.samples:
+            timings = run_scale(samples, args, work_dir, log)
+            results[str(samples)] = timings
+            print('{:>8} {}'.format(samples, ' '.join('{:>24.4f}s'.format(timings[phase]) for phase in PHASES)))
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
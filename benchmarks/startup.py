@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+""" Check of the cold start of the command line entry points, with the imports
+reported by `python -X importtime`. Fails if listing the options imports any of
+the heavy modules that are only needed to make reports, or if the imports take
+longer than the budget, e.g.
+
+    python -m benchmarks.startup --budget 60
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+COMMANDS = {
+    'ngi_reports --help': ['-m', 'ngi_reports.ngi_reports', '--help'],
+    'ngi_reports --version': ['-m', 'ngi_reports.ngi_reports', '--version'],
+    'ngi_reports_batch --help': ['-m', 'ngi_reports.batch', '--help'],
+}
+# modules only needed to make or render reports
+HEAVY_MODULES = ('jinja2', 'markdown', 'couchdb', 'yaml', 'numpy', 'multiprocessing')
+# import time allowed per command, in milliseconds, also checked by the test suite
+BUDGET_MS = 60.0
+
+def import_times(args):
+    """Run python with the given arguments and -X importtime, return the
+    cumulative import time in microseconds of each top level import and the
+    names of all imported modules
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=REPO_DIR, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    top_level = {}
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # nested imports are indented below the module importing them
+        if not name[1:].startswith(' '):
+            top_level[name.strip()] = int(cumulative)
+    return top_level, modules
+
+def check(command, args, budget_ms, repeat):
+    """Return True if the command stays within the budget and imports none of
+    the heavy modules, print its import time and slowest imports
+    """
+    # the best of several runs, so a busy machine does not fail the check
+    runs = [import_times(args) for _ in range(repeat)]
+    top_level, modules = min(runs, key=lambda run: sum(run[0].values()))
+    total_ms = sum(top_level.values()) / 1000.0
+    heavy = sorted(m for m in modules if m.split('.')[0] in HEAVY_MODULES)
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:3]
+    print('{:<26} {:>8.1f} ms  slowest: {}'.format(command, total_ms, ', '.join('{} {:.1f} ms'.format(m, t / 1000.0) for m, t in slowest)))
+    ok = True
+    if heavy:
+        print('  FAIL imports {}'.format(', '.join(sorted(set(m.split('.')[0] for m in heavy)))))
+        ok = False
+    if total_ms > budget_ms:
+        print('  FAIL over the budget of {:.1f} ms'.format(budget_ms))
+        ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the command line entry points against a budget")
+    parser.add_argument('--budget', default=BUDGET_MS, type=float, help="Import time allowed per command, in milliseconds")
+    parser.add_argument('--repeat', default=3, type=int, help="Number of runs of each command, the fastest one is checked")
+    args = parser.parse_args()
+
+    results = [check(command, command_args, args.budget, args.repeat) for command, command_args in sorted(COMMANDS.items())]
+    if not all(results):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+""" Generator of synthetic StatusDB data for the benchmarks: a project document
+and flowcell documents shaped like the ones `Project.populate` reads, written to
+a fixture store that can be replayed with `--replay_statusdb`
+"""
+
+import random
+
+from ngi_reports.utils import flowcell_parsers, statusdb_fixtures
+
+PROJECT_ID = 'P1000'
+PROJECT_NAME = 'A.Test_20_01'
+
+# Instrument id, database and run parameters of each flowcell type
+INSTRUMENTS = {
+    'HiSeqX': ('ST-E00201', 'x_flowcells',
+               {'Setup': {'Sbs': 'HiSeq X SBS Kit', 'ApplicationName': 'HiSeq Control Software',
+                          'ApplicationVersion': '3.4.0.38', 'RTAVersion': '2.7.7'}}),
+    'NovaSeq6000': ('A00187', 'x_flowcells',
+                    {'WorkflowType': 'NovaSeqXp', 'RfidsInfo': {'FlowCellMode': 'S4'}, 'RtaVersion': 'v3.4.4',
+                     'Application': 'NovaSeq Control Software', 'ApplicationVersion': '1.7.0'}),
+    'NextSeq500': ('NS500605', 'x_flowcells',
+                   {'Chemistry': 'NextSeq High', 'RTAVersion': '2.11.3', 'Setup': {'ApplicationName': 'NextSeq Control Software',
+                                                                                  'ApplicationVersion': '4.0.1.41'}}),
+    'NextSeq2000': ('VH00203', 'x_flowcells',
+                    {'FlowCellMode': 'NextSeq 1000/2000 P3 Flow Cell', 'RTAVersion': '3.10.30',
+                     'ApplicationName': 'NextSeq 1000/2000 Control Software', 'ApplicationVersion': '1.4.1.39716'}),
+    'HiSeq2500': ('D00410', 'flowcells',
+                  {'Setup': {'ReagentKitVersion': 'Version4', 'ApplicationName': 'HiSeq Control Software',
+                             'ApplicationVersion': '2.2.68', 'RTAVersion': '1.18.66'}}),
+    'MiSeq': ('M01548', 'flowcells', {'ReagentKitVersion': 'Version3', 'RTAVersion': '1.18.54', 'MCSVersion': '2.6.2.1'}),
+}
+
+def sample_ids(samples, project_id=PROJECT_ID):
+    """Return the ids of the given number of samples of a project"""
+    return ['{}_{}'.format(project_id, 101 + i) for i in range(samples)]
+
+def project_document(samples, preps=1, project_id=PROJECT_ID, project_name=PROJECT_NAME, seed=1):
+    """Return a project document with the given number of samples, each with
+    the given number of library preps
+
+    :param int samples: number of samples of the project
+    :param int preps: number of library preps per sample
+    """
+    rnd = random.Random(seed)
+    sample_docs = {}
+    for i, sample_id in enumerate(sample_ids(samples, project_id)):
+        library_prep = {}
+        for p in range(preps):
+            library_prep[chr(ord('A') + p)] = {
+                'reagent_label': 'IDX{:05d}-{}'.format(i, p), 'prep_status': 'PASSED',
+                'library_validation': {'24-{}'.format(1000 + p): {'start_date': '2020-02-{:02d}'.format(1 + p % 28),
+                                                                   'average_size_bp': round(rnd.uniform(250, 600), 4)}}}
+        sample_docs[sample_id] = {'customer_name': 'Sample_{}'.format(i), 'well_location': '{}:{}'.format('ABCDEFGH'[i % 8], 1 + i // 8 % 12),
+                                  'initial_qc': {'initial_qc_status': 'PASSED', 'concentration': round(rnd.uniform(1, 50), 2),
+                                                 'conc_units': 'ng/ul', 'volume_(ul)': 20, 'amount_(ng)': 200, 'rin': 8.1},
+                                  'details': {'total_reads_(m)': round(rnd.uniform(5, 50), 2)},
+                                  'library_prep': library_prep}
+    return {'_id': 'project_{}'.format(project_id), '_rev': '1-a', 'source': 'lims',
+            'project_name': project_name, 'project_id': project_id, 'no_of_samples': samples,
+            'contact': 'user@example.com', 'application': 'RNA-seq', 'reference_genome': 'hg38', 'uppnex_id': 'sens2020001',
+            'details': {'open_date': '2020-01-01', 'type': 'Production', 'customer_project_reference': 'ref1',
+                        'sequence_units_ordered_(lanes)': 4, 'library_construction_method': 'Total RNA, RiboZero, Strand-specific, Standard, -',
+                        'library_prep_option': '', 'best_practice_bioinformatics': 'No',
+                        'accredited_(library_preparation)': 'Yes', 'accredited_(data_processing)': 'No',
+                        'accredited_(sequencing)': 'Yes', 'accredited_(data_analysis)': 'N/A',
+                        'sequencing_platform': 'NovaSeq 6000', 'sequencing_setup': '2x150'},
+            'project_summary': {}, 'samples': sample_docs}
+
+def stat_row(db, project, lane, sample, barcode, rnd):
+    """Return a Barcode_lane_statistics row in the shape of given database"""
+    sample_key, barcode_key, qval_key, base_key = flowcell_parsers.STAT_KEYS.get(db, flowcell_parsers.DEFAULT_STAT_KEYS)
+    return {'Project': project, 'Lane': str(lane), sample_key: sample, barcode_key: barcode,
+            qval_key: '{:.2f}'.format(80 + rnd.random() * 15), base_key: '{:,}'.format(rnd.randint(1000000, 9000000))}
+
+def flowcell_document(doc_id, run_name, instrument, stats, lanes):
+    """Return a flowcell document of the given instrument type with the given
+    lane statistics rows and a lane summary for each lane
+
+    :param str instrument: flowcell type, one of INSTRUMENTS
+    :param list stats: rows of Barcode_lane_statistics
+    :param int lanes: number of lanes of the flowcell
+    """
+    instrument_id, db, run_params = INSTRUMENTS[instrument]
+    lane_summary = {str(l): {'Clusters PF R1': 400123456.0, 'Clusters PF R2': 400123456.0, 'Reads PF (M) R1': 400.5,
+                             'Reads PF (M) R2': 400.25, '% Bases >=Q30 R1': 91.2, '% Bases >=Q30 R2': 88.5,
+                             '% Error Rate R1': 0.42, '% Error Rate R2': 0.51}
+                    for l in range(1, lanes + 1)}
+    return {'_id': doc_id, '_rev': '1-a', 'name': run_name,
+            'RunInfo': {'Instrument': instrument_id, 'Reads': [{'Number': '1', 'NumCycles': '151', 'IsIndexedRead': 'N'},
+                                                                {'Number': '2', 'NumCycles': '8', 'IsIndexedRead': 'Y'},
+                                                                {'Number': '3', 'NumCycles': '151', 'IsIndexedRead': 'N'}]},
+            'RunParameters': run_params,
+            'DemultiplexConfig': {'Setup': {'Software': {'Version': 'bcl2fastq_v2.20.0'}}},
+            'illumina': {'Demultiplex_Stats': {'Barcode_lane_statistics': stats}},
+            'lims_data': {'run_summary': lane_summary}}
+
+def synthetic_statusdb(samples, preps=1, flowcells=4, lanes=4, instruments=('NovaSeq6000',), other_projects=2, seed=1):
+    """Return the documents of a synthetic project and its flowcells, keyed by database
+
+    :param int samples: number of samples of the project
+    :param int preps: number of library preps per sample
+    :param int flowcells: number of flowcells the project was sequenced on
+    :param int lanes: number of lanes per flowcell, samples are spread over them
+    :param tuple instruments: flowcell types, used in turn for the flowcells
+    :param int other_projects: number of other projects sharing each lane, with as many samples
+    """
+    rnd = random.Random(seed)
+    dbs = {'projects': [project_document(samples, preps, seed=seed)], 'flowcells': [], 'x_flowcells': []}
+    ids = sample_ids(samples)
+    for f in range(flowcells):
+        instrument = instruments[f % len(instruments)]
+        db = INSTRUMENTS[instrument][1]
+        fc_name = '000000000-A{:04d}'.format(f) if instrument == 'MiSeq' else 'H{:04d}BCXX'.format(f)
+        run_name = '20{:02d}{:02d}_{}'.format(1 + f // 28 % 12, 1 + f % 28, fc_name)
+        # HiSeq style databases have the project with underscores
+        project = PROJECT_NAME.replace('.', '__') if db == 'flowcells' else PROJECT_NAME
+        stats = []
+        for i, sample in enumerate(ids):
+            lane = 1 + i % lanes
+            stats.append(stat_row(db, project, lane, sample, 'IDX{:05d}-0'.format(i), rnd))
+            for k in range(other_projects):
+                stats.append(stat_row(db, 'B.Other_{}'.format(k), lane, 'P2{:03d}_{}'.format(k, 101 + i), 'IDX{:05d}-0'.format(i), rnd))
+        doc = flowcell_document('flowcell_{}'.format(f), run_name, instrument, stats, lanes)
+        doc['project_ids'] = [PROJECT_ID] + ['P2{:03d}'.format(k) for k in range(other_projects)]
+        dbs[db].append(doc)
+    return dbs
+
+def write_fixtures(dbs, path):
+    """Write documents to a fixture store, with the view rows the report
+    connections look up, so they can be replayed
+
+    :param dict dbs: documents keyed by database, as given by synthetic_statusdb
+    :param str path: fixture directory or '.sqlite' file
+    """
+    store = statusdb_fixtures.open_store(path)
+    for dbname, docs in dbs.items():
+        for doc in docs:
+            store.put_doc(dbname, {k: v for k, v in doc.items() if k != 'project_ids'})
+        if dbname == 'projects':
+            store.put_rows(dbname, 'project/project_name', [{'key': d['project_name'], 'id': d['_id'], 'value': None} for d in docs])
+            store.put_rows(dbname, 'project/project_id', [{'key': d['project_id'], 'id': d['_id'], 'value': None} for d in docs])
+        else:
+            store.put_rows(dbname, 'names/name', [{'key': d['name'], 'id': d['_id'], 'value': None} for d in docs])
+            store.put_rows(dbname, 'names/project_ids_list', [{'key': d['name'], 'id': d['_id'], 'value': d['project_ids']} for d in docs])
+    return store
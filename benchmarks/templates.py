@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+""" Benchmark of loading the report templates: compiling them from source, as
+each run did before the compiled templates were cached, loading them from a warm
+bytecode cache, as a later run does, and getting them again from the shared
+environment of the process, as every report of a batch run after the first does, e.g.
+
+    python -m benchmarks.templates --repeat 20
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from ngi_reports.ngi_reports import REPORTS_DIR, get_jinja2_env
+
+def template_names(reports_dir):
+    """Return the names of the markdown and HTML templates of the report types"""
+    return sorted(fl for fl in os.listdir(reports_dir) if fl.endswith(('.md', '.html')) and fl != 'swedac.html')
+
+def load_all(env, names):
+    for name in names:
+        env.get_template(name)
+
+def best_time(func, repeat):
+    """Return the best wall time of calling func repeat times"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time loading the report templates with and without the compiled template cache")
+    parser.add_argument('--repeat', default=10, type=int, help="Number of timed runs of each way, the best one is reported")
+    args = parser.parse_args()
+
+    names = template_names(REPORTS_DIR)
+    cache_dir = tempfile.mkdtemp(prefix='ngi_reports_template_cache_')
+    try:
+        # the environments are built with the undecorated function, to get a fresh one each time
+        new_env = get_jinja2_env.__wrapped__
+        timings = [('compile from source', best_time(lambda: load_all(new_env(REPORTS_DIR, cache_dir=None), names), args.repeat))]
+        load_all(new_env(REPORTS_DIR, cache_dir=cache_dir), names)
+        timings.append(('warm bytecode cache', best_time(lambda: load_all(new_env(REPORTS_DIR, cache_dir=cache_dir), names), args.repeat)))
+        env = new_env(REPORTS_DIR, cache_dir=cache_dir)
+        load_all(env, names)
+        timings.append(('shared environment', best_time(lambda: load_all(env, names), args.repeat)))
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print('Loading {} templates: {}'.format(len(names), ', '.join(names)))
+    compile_seconds = timings[0][1]
+    for way, seconds in timings:
+        print('{:<22} {:>10.4f}s {:>10.4f}s saved'.format(way, seconds, compile_seconds - seconds))
+
+if __name__ == "__main__":
+    main()
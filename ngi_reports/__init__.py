@@ -1,3 +1,3 @@
 """ Main ngi_reports module
 """
-__version__="1.0.0"
+__version__="20261017.25"
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+""" Entry point to generate 'project_summary' reports for many projects in one
+process, sharing the StatusDB connections, view indexes and Jinja environment
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ngi_reports.ngi_reports import LOG, REPORTS_DIR, get_jinja2_env, make_reports, report_arguments, clear_project_cache, log_connection_stats, set_debug_logging, write_profile
+from ngi_reports.utils import config as report_config
+from ngi_reports.utils import profiling
+
+def read_projects(projects=None, projects_file=None):
+    """Return the given projects followed by the ones listed in the file, one
+    per line, skipping empty lines, comments and duplicates
+
+    :param list projects: project names/ids
+    :param str projects_file: path to a file with project names/ids
+    """
+    projects = list(projects or [])
+    if projects_file:
+        with open(projects_file) as f:
+            projects.extend(l.strip() for l in f if l.strip() and not l.startswith('#'))
+    return list(dict.fromkeys(projects))
+
+def make_project_report(project, working_dir, **kwargs):
+    """Generate the report of one project, return a tuple (project, status,
+    seconds, error) instead of raising so one failing project doesn't stop the batch
+
+    :param str project: project name/id
+    :param str working_dir: working directory, '$project' is replaced by the project
+    """
+    start = time.time()
+    try:
+        with profiling.span('project {}'.format(project)):
+            make_reports('project_summary', working_dir=report_config.expand_path(working_dir, {'project': project}),
+                         project=project, **kwargs)
+    except KeyboardInterrupt:
+        raise
+    # populate stops with SystemExit or bare BaseException on bad projects
+    except BaseException as e:
+        LOG.error('Could not generate report for project {}: {!r}'.format(project, e))
+        return (project, 'failed', time.time() - start, repr(e))
+    return (project, 'ok', time.time() - start, '')
+
+def write_summary(results, summary_file=None):
+    """Log a per project summary of the batch and write it as a TSV file
+
+    :param list results: tuples (project, status, seconds, error)
+    :param str summary_file: path of the TSV file to write
+    """
+    LOG.info('Batch summary: {} of {} projects ok'.format(sum(r[1] == 'ok' for r in results), len(results)))
+    for project, status, seconds, error in results:
+        LOG.info('{}\t{}\t{:.2f}s\t{}'.format(project, status, seconds, error))
+    if summary_file:
+        with open(summary_file, 'w') as fh:
+            print('project\tstatus\tseconds\terror', file=fh)
+            for project, status, seconds, error in results:
+                print('{}\t{}\t{:.2f}\t{}'.format(project, status, seconds, error), file=fh)
+        LOG.info('Batch summary written to: {}'.format(summary_file))
+
+def main():
+    parser = argparse.ArgumentParser("Make NGI 'project_summary' reports for many projects", parents=[report_arguments()])
+    parser.add_argument('projects', nargs="*", metavar='<project>', help="Project names/ids to generate reports for")
+    parser.add_argument('-f', '--projects_file', default=None, action="store", help="File with project names/ids to generate reports for, one per line")
+    parser.add_argument('-j', '--parallel', default=1, action="store", type=int, help="Number of projects to generate reports for at the same time")
+    parser.add_argument('--summary_file', default=None, action="store", help="Write the status and time taken per project to this TSV file")
+
+    kwargs = vars(parser.parse_args())
+    if kwargs['debug']:
+        set_debug_logging()
+    if kwargs['clear_project_cache']:
+        clear_project_cache()
+    profile_file = kwargs.pop('profile')
+    if profile_file:
+        profiling.PROFILER.enable()
+
+    projects = read_projects(kwargs.pop('projects'), kwargs.pop('projects_file'))
+    if not projects:
+        parser.error('No projects given, use positional arguments and/or --projects_file')
+    parallel = kwargs.pop('parallel')
+    summary_file = kwargs.pop('summary_file')
+    working_dir = kwargs.pop('working_dir')
+
+    # everything that doesn't depend on the project is set up once
+    with profiling.span('load config'):
+        kwargs['config'] = report_config.load_config(kwargs.pop('config_file'))
+    kwargs['jinja2_env'] = get_jinja2_env(REPORTS_DIR)
+    from ngi_reports.utils import statusdb, statusdb_fixtures
+    backend = statusdb_fixtures.get_backend(record=kwargs['record_statusdb'], replay=kwargs['replay_statusdb'])
+    connections = statusdb.ReportConnections(lazy=not kwargs['preload_views'], snapshot=not kwargs['no_view_snapshot'],
+                                             log=LOG, backend=backend)
+    with profiling.span('build indexes'):
+        connections.build_indexes()
+    kwargs['statusdb_connections'] = connections
+
+    LOG.info('Generating reports for {} projects, {} at a time'.format(len(projects), parallel))
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        results = list(executor.map(lambda p: make_project_report(p, working_dir, **kwargs), projects))
+    LOG.info('Generated reports for {} projects in {:.2f}s'.format(len(projects), time.time() - start))
+    write_summary(results, summary_file)
+    log_connection_stats()
+    if profile_file:
+        write_profile(profile_file)
+
+    if any(r[1] != 'ok' for r in results):
+        raise SystemExit(1)
+
+# calling main method to generate reports
+if __name__ == "__main__":
+    main()
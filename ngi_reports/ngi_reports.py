@@ -6,43 +6,61 @@
 from __future__ import print_function
 
 import argparse
-import jinja2
+import functools
+import glob
 import json
+import logging
 import os
-import markdown
+import re
 
 from ngi_reports import __version__
 from ngi_reports.log import loggers
 from ngi_reports.utils import config as report_config
-from ngi_reports.utils.entities import Project
+from ngi_reports.utils import profiling
+
+# jinja2, markdown, the StatusDB, entity and project cache modules (couchdb, yaml,
+# numpy, pickle) and the process pool are imported where they are used, so the
+# options can be listed without loading them
 
 LOG = loggers.minimal_logger('NGI Reports')
 
 ## CONSTANTS
-# create choices for report type based on available report template
-allowed_report_types = [ fl.replace(".md","") for fl in os.listdir(os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'report_templates'))) ] + ['ign_aggregate_report']
+REPORTS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'report_templates'))
+# compiled templates are kept here between runs, entries are checked against the template source
+TEMPLATE_CACHE_DIR = os.path.join(os.environ.get('HOME', ''), '.ngi_reports', 'template_cache')
+MARKDOWN_EXTENSIONS = ['meta', 'tables', 'def_list', 'fenced_code', 'mdx_outline']
+# placeholders replaced in the HTML reports, table body placeholders end up as the
+# first cell of a row of empty cells after the markdown conversion
+PLACEHOLDER_PAT = re.compile(r'\[swedac\]|\[tick\]|\[cross\]|<tr>\n<td>\[table_body:(?P<table>\w+)\]</td>\n(?:<td></td>\n)*</tr>')
+
+# Jinja environment and Markdown converter of a render worker process
+_render_worker = {}
 
-def make_reports (report_type, working_dir=os.getcwd(), config_file=None, **kwargs):
+def make_reports (report_type, working_dir=os.getcwd(), config_file=None, config=None, jinja2_env=None, **kwargs):
+    from ngi_reports.utils.entities import Project
 
     # Setup
     template_fn = '{}.md'.format(report_type)
     LOG.info('Report type: {}'.format(report_type))
 
-    # use default config or override it if file is specified
-    config = report_config.load_config(config_file)
+    # use default config or override it if file is specified, unless a loaded one is given
+    if not config:
+        with profiling.span('load config'):
+            config = report_config.load_config(config_file)
 
     # Import the modules for this report type
     report_mod = __import__('ngi_reports.reports.{}'.format(report_type), fromlist=['ngi_reports.reports'])
 
     proj = Project()
-    proj.populate(LOG, config._sections['organism_names'], **kwargs)
+    with profiling.span('populate'):
+        proj.populate(LOG, config._sections['organism_names'], **kwargs)
 
     # Make the report object
     report = report_mod.Report(LOG, working_dir, **kwargs)
 
     # Work out all of the directory names
     output_dir = os.path.realpath(os.path.join(working_dir, report.report_dir))
-    reports_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'report_templates'))
+    reports_dir = REPORTS_DIR
 
     # Create the directory if we don't already have it
     if not os.path.exists(output_dir):
@@ -51,83 +69,271 @@ def make_reports (report_type, working_dir=os.getcwd(), config_file=None, **kwar
     # Print the markdown output file
     # Load the Jinja2 template
     try:
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(reports_dir))
+        env = jinja2_env or get_jinja2_env(reports_dir)
         template = env.get_template('{}.md'.format(report_type))
     except:
         LOG.error('Could not load the Jinja report template')
         raise
 
-    # Change to the reports directory
-    old_cwd = os.getcwd()
-    os.chdir(report.report_dir)
-
     # Get parsed markdown and print to file(s)
     LOG.debug('Converting markdown to HTML...')
-    output_mds = report.generate_report_template(proj, template, config.get('ngi_reports', 'support_email'))
-    for output_bn, output_md in list(output_mds.items()):
-        try:
-            with open('{}.md'.format(output_bn), 'w', encoding='utf-8') as fh:
-                print(output_md, file=fh)
-        except IOError as e:
-            LOG.error("Error printing markdown report {} - skipping. {}".format(output_md, IOError(e)))
-            continue
-        #Convert markdown to html
-        html_out = markdown_to_html(report_type, jinja2_env=env, markdown_text=output_md, reports_dir=reports_dir,
-                                    out_path='{}.html'.format(output_bn))
-        LOG.info('{} HTML report written to: {}'.format(output_bn.rsplit('/', 1)[1], html_out))
+    with profiling.span('generate_report_template'):
+        output_mds = report.generate_report_template(proj, template, config.get('ngi_reports', 'support_email'))
+    render_outputs(report_type, output_mds, reports_dir, jinja2_env=env, workers=kwargs.get('render_workers') or 1,
+                   html_outputs=getattr(report, 'html_outputs', None), json_tables=kwargs.get('json_tables'))
 
     # Generate CSV files for project_summary reports
     if report_type == 'project_summary' and not kwargs['no_txt']:
         try:
-            report.create_txt_files()
+            with profiling.span('create_txt_files'):
+                report.create_txt_files(op_dir=report.report_dir, compress=kwargs.get('gzip_txt'))
             LOG.info('Generated TXT files...')
         except:
             LOG.error('Could not generate TXT files...')
 
-    # Change back to previous working dir
-    os.chdir(old_cwd)
+@functools.lru_cache(maxsize=None)
+def get_jinja2_env(reports_dir=REPORTS_DIR, cache_dir=TEMPLATE_CACHE_DIR):
+    """Return the Jinja environment for the templates in given directory, one
+    per process so the compiled templates are shared between all reports and
+    both the markdown and HTML stages. The compiled templates are also kept in
+    the cache directory, so later runs do not have to compile them again. Jinja
+    checks a cached template against a checksum of its source, so edited
+    templates are compiled again.
+
+    :param str cache_dir: directory for the compiled templates, not cached between runs if None
+    """
+    import jinja2
+    bytecode_cache = None
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if not os.access(cache_dir, os.W_OK):
+                raise OSError('directory is not writable')
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+        except OSError as e:
+            LOG.debug('Not caching the compiled templates in {}: {}'.format(cache_dir, e))
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(reports_dir), bytecode_cache=bytecode_cache)
+
+@functools.lru_cache(maxsize=None)
+def read_swedac_text(reports_dir=REPORTS_DIR):
+    """Return the swedac text added to the reports, read once per process"""
+    with open(os.path.join(reports_dir, 'swedac.html'), 'r') as f:
+        return f.read()
+
+def new_markdown_converter():
+    """Return a Markdown converter with the extensions used for the reports"""
+    import markdown
+    return markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+
+def init_render_worker(reports_dir):
+    """Set up the Jinja environment and Markdown converter of a render worker process"""
+    _render_worker['env'] = get_jinja2_env(reports_dir)
+    _render_worker['md'] = new_markdown_converter()
+
+def render_output(report_type, output_bn, output_md, reports_dir, jinja2_env=None, md_converter=None, html_output=None,
+                  json_tables=False):
+    """Write the markdown of one report output and convert it to HTML, with the
+    Jinja environment and Markdown converter of the render worker if none are given
+
+    :param tuple html_output: markdown with table placeholders to convert instead,
+                              and the HTML table bodies to put in, if the report has them
+    :param bool json_tables: the table bodies are embedded JSON, add the script showing them
+
+    :return: tuple of the path of the HTML file and None, or None and the error
+             if the markdown could not be written
+    """
+    try:
+        with open('{}.md'.format(output_bn), 'w', encoding='utf-8') as fh:
+            print(output_md, file=fh)
+    except IOError as e:
+        return None, str(e)
+    html_md, table_bodies = html_output or (output_md, None)
+    with profiling.span('markdown_to_html'):
+        html_out = markdown_to_html(report_type, jinja2_env=jinja2_env or _render_worker.get('env'), markdown_text=html_md,
+                                    reports_dir=reports_dir, out_path='{}.html'.format(output_bn),
+                                    md_converter=md_converter or _render_worker.get('md'), table_bodies=table_bodies,
+                                    json_tables=json_tables)
+    return html_out, None
+
+def render_outputs(report_type, output_mds, reports_dir, jinja2_env=None, workers=1, html_outputs=None, json_tables=False):
+    """Write the markdown of each report output and convert it to HTML. Several
+    outputs are rendered on a pool of worker processes if more than one worker is
+    asked for. Progress and errors are logged per output, the first error is
+    raised once all outputs are done.
+
+    :param dict output_mds: markdown text of each output, keyed by output basename
+    :param int workers: number of worker processes
+    :param dict html_outputs: markdown with table placeholders and HTML table bodies of the
+                              outputs that have them, keyed by output basename
+    :param bool json_tables: the table bodies are embedded JSON
+    """
+    outputs = list(output_mds.items())
+    html_outputs = html_outputs or {}
+    errors = []
+
+    def log_result(output_bn, result):
+        html_out, md_error = result
+        if md_error:
+            LOG.error("Error printing markdown report {} - skipping. {}".format(output_bn, md_error))
+        else:
+            LOG.info('{} HTML report written to: {}'.format(output_bn.rsplit('/', 1)[1], html_out))
+
+    if workers > 1 and len(outputs) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=min(workers, len(outputs)), initializer=init_render_worker, initargs=(reports_dir,)) as executor:
+            futures = {executor.submit(render_output, report_type, output_bn, output_md, reports_dir,
+                                       html_output=html_outputs.get(output_bn), json_tables=json_tables): output_bn
+                       for output_bn, output_md in outputs}
+            for done, future in enumerate(as_completed(futures), 1):
+                output_bn = futures[future]
+                try:
+                    log_result(output_bn, future.result())
+                except Exception as e:
+                    LOG.error('Could not render report {}: {!r}'.format(output_bn, e))
+                    errors.append(e)
+                LOG.info('Rendered {} of {} reports'.format(done, len(outputs)))
+    else:
+        md_converter = new_markdown_converter()
+        for output_bn, output_md in outputs:
+            try:
+                log_result(output_bn, render_output(report_type, output_bn, output_md, reports_dir, jinja2_env=jinja2_env,
+                                                    md_converter=md_converter, html_output=html_outputs.get(output_bn),
+                                                    json_tables=json_tables))
+            except Exception as e:
+                LOG.error('Could not render report {}: {!r}'.format(output_bn, e))
+                errors.append(e)
+    if errors:
+        raise errors[0]
+
+def expand_markdown_paths(patterns):
+    """Return the markdown files matching the given paths and glob patterns, in
+    the given order without duplicates, paths that match nothing are kept as they are
+    """
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(paths))
 
-def markdown_to_html(report_type, jinja2_env=None, markdown_text=None, markdown_path=None, reports_dir=None, out_path=None):
+def regenerate_one(report_type, markdown_path):
+    """Convert one markdown file to HTML with the Jinja environment and Markdown
+    converter of the render worker
+
+    :return: tuple of the path of the HTML file and None, or None and the error
+    """
+    try:
+        return markdown_to_html(report_type, markdown_path=markdown_path, jinja2_env=_render_worker.get('env'),
+                                md_converter=_render_worker.get('md')), None
+    except Exception as e:
+        return None, repr(e)
+
+def regenerate_html(report_type, markdown_paths, workers=1):
+    """Regenerate the HTML reports of the given markdown files with one reused
+    Markdown converter, or on a pool of worker processes if more than one worker
+    is asked for. Errors are logged per file.
+
+    :param list markdown_paths: paths of the markdown files
+    :param int workers: number of worker processes
+    :return: the number of files that could not be converted
+    """
+    failed = 0
+    def log_result(markdown_path, result):
+        html_out, error = result
+        if error:
+            LOG.error('Could not regenerate the HTML report of {}: {}'.format(markdown_path, error))
+            return 1
+        print('HTML report written to: '+html_out)
+        return 0
+
+    if workers > 1 and len(markdown_paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(markdown_paths)), initializer=init_render_worker, initargs=(REPORTS_DIR,)) as executor:
+            results = executor.map(regenerate_one, [report_type] * len(markdown_paths), markdown_paths)
+            for markdown_path, result in zip(markdown_paths, results):
+                failed += log_result(markdown_path, result)
+    else:
+        init_render_worker(REPORTS_DIR)
+        for markdown_path in markdown_paths:
+            failed += log_result(markdown_path, regenerate_one(report_type, markdown_path))
+    return failed
+
+def log_connection_stats():
+    from ngi_reports.utils import statusdb
+    conn_stats = statusdb.connection_stats()
+    if conn_stats:
+        LOG.info('StatusDB connections opened: {}, reused: {}'.format(conn_stats['opened'], conn_stats['reused']))
+
+def write_profile(profile_file):
+    """Log the profiled phases of the run as a table and write them to a JSON file"""
+    profiler = profiling.PROFILER
+    LOG.info('Profile of the run:\n{}'.format(profiler.table()))
+    profiler.dump(profile_file)
+    LOG.info('Profile written to: {}'.format(os.path.realpath(profile_file)))
+
+@functools.lru_cache(maxsize=None)
+def get_report_types(reports_dir=REPORTS_DIR):
+    """Return the report types to choose from, based on the available report
+    templates, looked up once per process when the options are parsed"""
+    return [ fl.replace(".md","") for fl in os.listdir(reports_dir) ] + ['ign_aggregate_report']
+
+def clear_project_cache():
+    from ngi_reports.utils import project_cache
+    project_cache.clear()
+    LOG.info('Cleared the project cache in {}'.format(project_cache.DEFAULT_CACHE_DIR))
+
+def set_debug_logging():
+    LOG.setLevel(logging.DEBUG)
+    for handler in LOG.handlers:
+        handler.setLevel(logging.DEBUG)
+
+def markdown_to_html(report_type, jinja2_env=None, markdown_text=None, markdown_path=None, reports_dir=None, out_path=None,
+                     md_converter=None, table_bodies=None, json_tables=False):
     #get path to template dir
     if not reports_dir:
-        reports_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'report_templates'))
+        reports_dir = REPORTS_DIR
     #get swedac text to add to report
-    with open(reports_dir+'/swedac.html', 'r') as f:
-        swedac_text = f.read()
+    swedac_text = read_swedac_text(reports_dir)
     #initialise jinja env
     if not jinja2_env:
-        jinja2_env = jinja2.Environment(loader=jinja2.FileSystemLoader(reports_dir))
+        jinja2_env = get_jinja2_env(reports_dir)
     #get markdown text
     if not markdown_text:
         with open(markdown_path, 'r') as f:
             markdown_text = f.read()
 
-    md_template = markdown.Markdown(extensions=['meta', 'tables', 'def_list', 'fenced_code', 'mdx_outline'])
+    #reuse the given converter, it only has to be reset between documents
+    if md_converter:
+        md_template = md_converter
+        md_template.reset()
+    else:
+        md_template = new_markdown_converter()
     markeddown_text = md_template.convert(markdown_text)
 
     #Markdown meta returns a dict with values as lists
     html_out = jinja2_env.get_template(report_type+'.html').render(body=markeddown_text,
-                                        meta={key: ''.join(value) for (key, value) in md_template.Meta.items()})
+                                        meta={key: ''.join(value) for (key, value) in md_template.Meta.items()},
+                                        json_tables=json_tables)
     replace_list = {'[swedac]': swedac_text,
                     '[tick]'  : '<span class="icon_tick">&#10004;</span> ',
                     '[cross]' : '<span class="icon_cross">&#10008;</span> '
                     }
-    for key in replace_list:
-        html_out = html_out.replace(key, replace_list[key])
+    #replace the placeholders and put in the table bodies rendered to HTML in one pass
+    def replace_placeholder(match):
+        if match.group('table'):
+            return (table_bodies or {}).get(match.group('table'), match.group(0))
+        return replace_list[match.group(0)]
+    html_out = PLACEHOLDER_PAT.sub(replace_placeholder, html_out)
     if not out_path:
         out_path = os.path.realpath(os.path.join(os.getcwd(), markdown_path.replace('md','html')))
     with open(out_path, 'w') as f:
         f.write(html_out)
     return out_path
 
-def main():
-    parser = argparse.ArgumentParser("Make an NGI Report")
-    parser.add_argument('report_type', choices=allowed_report_types, metavar='<report type>',
-        help="Type of report to generate. Choose from: {}".format(', '.join(allowed_report_types)))
+def report_arguments():
+    """Return a parser with the report options, shared by the single report and batch entry points"""
+    parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument("-d", "--dir", dest="working_dir", default=os.getcwd(),
         help="Working Directory. Default: cwd when script is executed.")
     parser.add_argument('-c', '--config_file', default=None, action="store", help="Configuration file to use instead of default (~/.ngi_config/ngi_reports.conf)")
-    parser.add_argument('-p', '--project', default=None, action="store", help="Project name to generate 'project_summary' report")
     parser.add_argument('-s', '--signature', default=None, action="store", help="Signature/Name for person who generates 'project_summary' report")
     parser.add_argument('-u', '--uppmax_id', default=None, action="store", help="Given UPPMAX id will be used while generating report")
     parser.add_argument('-q', '--quality', default=None, action="store", type=int, help="Q30 threshold for samples to set status")
@@ -135,18 +341,65 @@ def main():
     parser.add_argument('--skip_fastq', action="store_true", help="Option to skip naming convention of fastq files from report")
     parser.add_argument('--exclude_fc', nargs="*", default=[], action="store", help="Exclude these FCs while processing, Format should be BH3JLWCCXX/000000000-AEUUP.")
     parser.add_argument('--no_txt', action="store_true", help="Use this option to not generate TXT files for tables")
-    parser.add_argument('--samples', default=None, action="store", nargs="*", help="Limit the samples to include in reports")
+    tables_mode = parser.add_mutually_exclusive_group()
+    tables_mode.add_argument('--markdown_tables', action="store_true", help="Convert the large tables to HTML through markdown like the rest of the report, instead of rendering them to HTML directly")
+    tables_mode.add_argument('--json_tables', action="store_true", help="Embed the large tables in the HTML report as JSON, shown a page at a time with sorting and filtering, for very large projects")
+    parser.add_argument('--gzip_txt', action="store_true", help="Write the TXT files for tables gzip compressed, as '.txt.gz'")
+    parser.add_argument('--samples', default=None, action="store", nargs="*", help="Limit the samples to include in reports, given as sample ids, glob patterns like 'P1234_1*' or regular expressions prefixed with 're:'")
+    parser.add_argument('--samples_file', default=None, action="store", help="File with more samples to include in reports, one sample id or pattern per line")
     parser.add_argument('--samples_extra', default={}, action="store", type=json.loads, help="Pass in extra information about samples as a json string, having each sample as a key. Example: --samples_extra '{\"TS001-1\": {\"delivered\": \"20150701\"}}'")
     parser.add_argument('--fc_phix', default={}, action="store", type=json.loads, help="Overwrite or use Phix values for mentioned flowcells/lanes provided as a json string, having each flowcell as a key. Example: --fc_phix '{\"BH3JLWCCXX\": {\"1\": \"0.42\", \"3\": \"0.46\"}}'")
+    parser.add_argument('--render_workers', default=1, action="store", type=int, help="Number of processes used to convert the markdown of reports with several outputs to HTML")
+    parser.add_argument('--preload_views', action="store_true", help="Load the full StatusDB views up front instead of looking up only the needed keys, useful for batch runs")
+    parser.add_argument('--fc_batch_size', default=None, action="store", type=int, help="Number of flowcell documents to fetch from StatusDB per request")
+    parser.add_argument('--no_view_snapshot', action="store_true", help="Download the flowcell project lists from StatusDB instead of updating the local snapshot in ~/.ngi_reports")
+    parser.add_argument('--workers', default=1, action="store", type=int, help="Number of threads used to fetch and parse flowcell documents from StatusDB")
+    parser.add_argument('--projected_fetch', action="store_true", help="Only fetch the run metadata and this project's lane statistics of flowcell documents, needs the 'names/project_lane_stats' view in StatusDB")
+    parser.add_argument('--stream_fc_docs', action="store_true", help="Only decode the needed parts of whole flowcell documents, to save memory when projected fetch is not used or available")
+    parser.add_argument('--record_statusdb', default=None, action="store", help="Save all data fetched from StatusDB to this directory or '.sqlite' file, to be replayed later")
+    parser.add_argument('--replay_statusdb', default=None, action="store", help="Use the StatusDB data recorded in this directory or '.sqlite' file instead of the live StatusDB")
+    parser.add_argument('--no_project_cache', action="store_true", help="Always populate the project from StatusDB, without using or updating the cached project in ~/.ngi_reports")
+    parser.add_argument('--clear_project_cache', action="store_true", help="Remove all cached projects before generating the report")
+    parser.add_argument('--profile', default=None, nargs='?', const=profiling.DEFAULT_PROFILE_FILE, action="store",
+        help="Log the time, StatusDB requests, bytes received and process peak memory so far of each phase of the run at the end, "
+             "and write them as JSON to the given file, '{}' by default".format(profiling.DEFAULT_PROFILE_FILE))
+    parser.add_argument('--debug', action="store_true", help="Log debug messages")
+    return parser
+
+def main():
+    parser = argparse.ArgumentParser("Make an NGI Report", parents=[report_arguments()])
+    report_types = get_report_types()
+    parser.add_argument('report_type', choices=report_types, metavar='<report type>',
+        help="Type of report to generate. Choose from: {}".format(', '.join(report_types)))
+    parser.add_argument('-p', '--project', default=None, action="store", help="Project name to generate 'project_summary' report")
     parser.add_argument('--version', action='version', version="NGI reports version - {}".format(__version__))
-    parser.add_argument('-md', '--markdown_file', default=None, help="Regenerate the html report from the given markdown file")
+    parser.add_argument('-md', '--markdown_file', default=None, action="append", help="Regenerate the html report from the given markdown file or glob pattern, e.g. 'delivered/*/reports/*.md', can be given several times")
 
     kwargs = vars(parser.parse_args())
 
+    if kwargs['debug']:
+        set_debug_logging()
+    if kwargs['clear_project_cache']:
+        clear_project_cache()
+    profile_file = kwargs.pop('profile')
+    if profile_file:
+        profiling.PROFILER.enable()
+
+    failed = 0
     if kwargs['markdown_file']:
-        print('HTML report written to: '+markdown_to_html(kwargs['report_type'], markdown_path=kwargs['markdown_file']))
+        markdown_paths = expand_markdown_paths(kwargs['markdown_file'])
+        with profiling.span('regenerate_html'):
+            failed = regenerate_html(kwargs['report_type'], markdown_paths, workers=kwargs['render_workers'])
+        if len(markdown_paths) > 1:
+            LOG.info('Regenerated {} of {} HTML reports'.format(len(markdown_paths) - failed, len(markdown_paths)))
     else:
-        make_reports(**kwargs)
+        with profiling.span('make_reports'):
+            make_reports(**kwargs)
+        log_connection_stats()
+    if profile_file:
+        write_profile(profile_file)
+    if failed:
+        raise SystemExit(1)
 
 # calling main method to generate report
 if __name__ == "__main__":
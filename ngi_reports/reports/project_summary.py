@@ -6,11 +6,25 @@ the SciLifeLab repo
 """
 
 from collections import defaultdict, OrderedDict
+import gzip
+import html
+import json
 import os
+import re
 from string import ascii_uppercase as alphabets
 
 import ngi_reports.reports
 
+# Columns of the tables that can be rendered straight to HTML, in the order of the
+# markdown tables of the template, as (row key, shown as code)
+HTML_TABLE_COLUMNS = {'sample_info': [('ngi_id', False), ('customer_name', True), ('total_reads', False), ('qscore', False)],
+                      'library_info': [('ngi_id', False), ('barcode', True), ('label', False), ('avg_size', False), ('qc_status', False)],
+                      'lanes_info': [('date', False), ('name', True), ('id', False), ('cluster', False), ('phix', False),
+                                     ('avg_qval', False), ('seq_meth', False)]}
+# Cells that python-markdown would leave as they are, others make the table go through markdown
+PLAIN_CELL = re.compile(r'^[\w.,:;%+/=() -]*$')
+EMPHASIS_UNDERSCORE = re.compile(r'(^|\W)_|_(\W|$)')
+
 
 class Report(ngi_reports.reports.BaseReport):
 
@@ -25,6 +39,10 @@ class Report(ngi_reports.reports.BaseReport):
         self.report_dir = os.path.join(working_dir, 'reports')
         self.report_basename = ''
         self.signature = kwargs.get('signature')
+        self.markdown_tables = kwargs.get('markdown_tables')
+        self.json_tables = kwargs.get('json_tables')
+        # markdown to convert to HTML and the HTML table bodies to put in it, per output
+        self.html_outputs = {}
 
 
     def generate_report_template(self, proj, template, support_email):
@@ -108,7 +126,9 @@ class Report(ngi_reports.reports.BaseReport):
         sample_header = ['NGI ID', 'User ID', proj.samples_unit, '>=Q30']
         sample_filter = ['ngi_id', 'customer_name', 'total_reads', 'qscore']
 
-        self.tables_info['tables']['sample_info'] = self.create_table_text(proj.samples.values(), filter_keys=sample_filter, header=sample_header)
+        ## the table rows are only generated when the TXT files are written, or the text is asked for
+        self.tables_info['tables']['sample_info'] = {'rows': lambda: (s.to_row() for s in proj.samples.values()),
+                                                     'filter_keys': sample_filter, 'header': sample_header}
         self.tables_info['header_explanation']['sample_info'] = '* _NGI ID:_ Internal NGI sample indentifier\n'\
                                                                 '* _User ID:_ User submitted name for a sample\n'\
                                                                 '* _{}:_ Total{} reads (or pairs) for a sample\n'\
@@ -118,13 +138,8 @@ class Report(ngi_reports.reports.BaseReport):
         ## library_info table
         library_header = ['NGI ID', 'Index', 'Lib Prep', 'Avg. FS', 'Lib QC']
         library_filter = ['ngi_id', 'barcode', 'label', 'avg_size', 'qc_status']
-        library_list = []
-        for s, v in list(proj.samples.items()):
-            for p in list(v.preps.values()):
-                p = vars(p)
-                p['ngi_id'] = s
-                library_list.append(p)
-        self.tables_info['tables']['library_info'] = self.create_table_text(sorted(library_list, key=lambda d: d['ngi_id']), filter_keys=library_filter, header=library_header)
+        library_rows = lambda: sorted((p.to_row(s) for s, v in proj.samples.items() for p in v.preps.values()), key=lambda d: d['ngi_id'])
+        self.tables_info['tables']['library_info'] = {'rows': library_rows, 'filter_keys': library_filter, 'header': library_header}
         self.tables_info['header_explanation']['library_info'] = '* _NGI ID:_ Internal NGI sample indentifier\n'\
                                                                  '* _Index:_ Barcode sequence used for the sample\n'\
                                                                  '* _Lib Prep:_ NGI library indentifier\n'\
@@ -134,16 +149,8 @@ class Report(ngi_reports.reports.BaseReport):
         ## lanes_info table
         lanes_header = ['Date', 'FC id', 'Lane', 'Cluster(M)', 'Phix', '>=Q30(%)', 'Method']
         lanes_filter = ['date', 'name', 'id', 'cluster', 'phix', 'avg_qval', 'seq_meth']
-        lanes_list = []
-        for f, v in list(proj.flowcells.items()):
-            for l in list(v.lanes.values()):
-                l = vars(l)
-                l['date'] = v.date
-                l['name'] = v.name
-                l['seq_meth'] = v.seq_meth
-                lanes_list.append(l)
-
-        self.tables_info['tables']['lanes_info'] = self.create_table_text(sorted(lanes_list, key=lambda d: '{}_{}'.format(d['date'],d['id'])), filter_keys=lanes_filter, header=lanes_header)
+        lanes_rows = lambda: sorted((l for v in proj.flowcells.values() for l in v.lane_rows()), key=lambda d: '{}_{}'.format(d['date'],d['id']))
+        self.tables_info['tables']['lanes_info'] = {'rows': lanes_rows, 'filter_keys': lanes_filter, 'header': lanes_header}
         self.tables_info['header_explanation']['lanes_info'] = '* _Date:_ Date of sequencing\n'\
                                                                '* _Flowcell:_ Flowcell identifier\n'\
                                                                '* _Lane:_ Flowcell lane number\n'\
@@ -155,9 +162,21 @@ class Report(ngi_reports.reports.BaseReport):
         # Make the file basename
         output_bn = os.path.realpath(os.path.join(self.working_dir, self.report_dir, '{}_project_summary'.format(self.report_basename)))
 
-        # Parse the template
+        # Parse the template, once with the markdown tables for the markdown report and once
+        # with placeholders for the HTML report if the tables can be rendered to HTML directly
+        # or embedded as JSON
         try:
-            md = template.render(project=proj, tables=self.tables_info['header_explanation'], report_info=self.report_info)
+            md = template.render(project=proj, tables=self.tables_info['header_explanation'], report_info=self.report_info, html_tables={})
+            if self.json_tables:
+                table_bodies = self.create_json_table_bodies(proj)
+            elif self.markdown_tables:
+                table_bodies = {}
+            else:
+                table_bodies = self.create_html_table_bodies(proj)
+            if table_bodies:
+                html_md = template.render(project=proj, tables=self.tables_info['header_explanation'], report_info=self.report_info,
+                                          html_tables=table_bodies)
+                self.html_outputs[output_bn] = (html_md, table_bodies)
             return {output_bn: md}
         except:
             self.LOG.error('Could not parse the project_summary template')
@@ -168,6 +187,27 @@ class Report(ngi_reports.reports.BaseReport):
     ##### Helper methods to get certain information #####
     #####################################################
 
+    def table_rows(self, ip, filter_keys=None, header=None):
+        """ Generate the rows of a table as lists of strings, the header first if
+            given, from given dicts/objects filtered based upon mentioned keys.
+
+            :param dict/list ip: Input dictionary/list/iterable of the table rows
+            :param list filter_keys: A list of keys that will be used to filter the rows, all keys if not given
+            :param list header: A list that will be used as header
+        """
+        if isinstance(ip, dict):
+            ip = list(ip.values())
+        if not filter_keys:
+            ip = list(ip)
+            filter_keys = sorted(set(k for i in ip for k in i.keys()))
+        if header:
+            yield list(header)
+        for i in ip:
+            if type(i) is dict:
+                yield [str(i.get(k, 'NA')) for k in filter_keys]
+            else:
+                yield [str(getattr(i, k, 'NA')) for k in filter_keys]
+
     def create_table_text(self, ip, filter_keys=None, header=None, sep='\t'):
         """ Create a single text string that will be saved in a file in TABLE format
             from given dict and filtered based upon mentioned header.
@@ -177,27 +217,77 @@ class Report(ngi_reports.reports.BaseReport):
             :param list header: A list that will be used as header
             :param str sep: A string that will be used as separator
         """
-        op_string = []
-        if isinstance(ip, dict):
-            ip = list(ip.values())
-        if header:
-            op_string.append(sep.join(header))
-        if not filter_keys:
-            filter_keys = []
-            for i in ip:
-                filter_keys.extend(list(i.keys()))
-            filter_keys = sorted(list(set(filter_keys)))
-        for i in ip:
-            row = []
-            for k in filter_keys:
-                if type(i) is dict:
-                    row.append(i.get(k,'NA'))
-                else:
-                    row.append(getattr(i, k, 'NA'))
-            row = list(map(str, row))
-            op_string.append(sep.join(row))
-        return '\n'.join(op_string)
+        return '\n'.join(sep.join(row) for row in self.table_rows(ip, filter_keys=filter_keys, header=header))
+
+    def get_table_text(self, table_name, sep='\t'):
+        """ Return the text of one of the report tables, for templates that need it
 
+            :param str table_name: name of the table, e.g. 'sample_info'
+            :param str sep: A string that will be used as separator
+        """
+        table = self.tables_info['tables'][table_name]
+        return self.create_table_text(table['rows'](), filter_keys=table['filter_keys'], header=table['header'], sep=sep)
+
+    def large_table_rows(self, proj):
+        """ Return the rows of the large tables, in the order of the markdown tables of the template
+
+            :param Project proj: Project object containing details of the relevant project
+            :return: dict of table name -> list of row dicts
+        """
+        # sorted case insensitively, as by the sort filter of jinja
+        samples = sorted(proj.samples.values(), key=lambda s: s.ngi_id.lower())
+        return {'sample_info': [s.to_row() for s in samples],
+                'library_info': [p.to_row(s.ngi_id) for s in samples for p in s.preps.values()],
+                'lanes_info': [l for fc in sorted(proj.flowcells.values(), key=lambda fc: fc.date.lower()) for l in fc.lane_rows()]}
+
+    def create_html_table_bodies(self, proj):
+        """ Render the bodies of the large tables straight to HTML from the rows, in the order
+            and the markup python-markdown would give the markdown tables of the template.
+            Tables with a cell python-markdown might change are left out, to go through markdown.
+
+            :param Project proj: Project object containing details of the relevant project
+            :return: dict of table name -> HTML rows
+        """
+        rows = self.large_table_rows(proj)
+        table_bodies = {}
+        for tb_nm, columns in HTML_TABLE_COLUMNS.items():
+            # markdown gives a row of empty cells for tables without rows
+            html_rows = [] if rows[tb_nm] else ['<tr>\n{}\n</tr>'.format('\n'.join(['<td></td>'] * len(columns)))]
+            for row in rows[tb_nm]:
+                cells = []
+                for key, code in columns:
+                    value = str(row[key]).strip()
+                    if code and value and '`' not in value and '|' not in value:
+                        cells.append('<td><code>{}</code></td>'.format(html.escape(value, quote=False)))
+                    elif not code and PLAIN_CELL.match(value) and not EMPHASIS_UNDERSCORE.search(value):
+                        cells.append('<td>{}</td>'.format(value))
+                    else:
+                        break
+                if len(cells) < len(columns):
+                    self.LOG.debug('Table {} has cells that need markdown, not rendering it to HTML directly'.format(tb_nm))
+                    break
+                html_rows.append('<tr>\n{}\n</tr>'.format('\n'.join(cells)))
+            else:
+                table_bodies[tb_nm] = '\n'.join(html_rows)
+        return table_bodies
+
+    def create_json_table_bodies(self, proj):
+        """ Embed the rows of the large tables as compact JSON, to be shown a page at a time
+            by the script of the HTML template, which sorts and filters them in the browser.
+            Cells are shown as plain text, without markdown formatting.
+
+            :param Project proj: Project object containing details of the relevant project
+            :return: dict of table name -> HTML script element with the rows
+        """
+        rows = self.large_table_rows(proj)
+        table_bodies = {}
+        for tb_nm, columns in HTML_TABLE_COLUMNS.items():
+            data = {'code': [code for _, code in columns],
+                    'rows': [[str(row[key]).strip() for key, _ in columns] for row in rows[tb_nm]]}
+            # '<' is escaped so no cell can end the script element
+            data_json = json.dumps(data, separators=(',', ':'), ensure_ascii=False).replace('<', '\\u003c')
+            table_bodies[tb_nm] = '<script type="application/json" class="table_data">{}</script>'.format(data_json)
+        return table_bodies
 
     def get_order_dates(self, project_dates):
         """ Get order dates as a markdown string. Ignore if unavailable
@@ -228,16 +318,24 @@ class Report(ngi_reports.reports.BaseReport):
         return accredit_info
 
     # Generate CSV files for the tables
-    def create_txt_files(self, op_dir=None):
+    def create_txt_files(self, op_dir=None, compress=False):
         """ Generate the CSV files for mentioned tables i.e. a dictionary with table name as key,
-            which will be used as file name and the content of file in single string as value to
-            put in the TXT file
+            which will be used as file name, streaming the rows of each table to its TXT file
 
             :param str op_dir: Path where the TXT files should be created, current dir is default
+            :param bool compress: Write gzip compressed '.txt.gz' files instead
         """
-        for tb_nm, tb_cont in list(self.tables_info['tables'].items()):
+        for tb_nm, table in list(self.tables_info['tables'].items()):
             op_fl = '{}_{}.txt'.format(self.report_basename, tb_nm)
             if op_dir:
                 op_fl = os.path.join(op_dir, op_fl)
-            with open(op_fl, 'w') as TXT:
-                TXT.write(tb_cont)
+            if compress:
+                TXT = gzip.open(op_fl + '.gz', 'wt')
+            else:
+                TXT = open(op_fl, 'w')
+            with TXT:
+                rows = self.table_rows(table['rows'](), filter_keys=table['filter_keys'], header=table['header'])
+                for n, row in enumerate(rows):
+                    if n:
+                        TXT.write('\n')
+                    TXT.write('\t'.join(row))
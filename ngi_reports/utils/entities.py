@@ -3,42 +3,66 @@
 import re
 import sys
 import numpy as np
-from collections import defaultdict, OrderedDict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from ngi_reports.utils import statusdb
-
+from ngi_reports.utils import flowcell_parsers, lane_metrics, profiling, project_cache, sample_selection, statusdb, statusdb_fixtures
 
 class Sample:
     """Sample class
     """
+    __slots__ = ('customer_name', 'ngi_id', 'preps', 'qscore', 'total_reads', '_initial_qc', 'well_location')
+    INITIAL_QC_FIELDS = ('initial_qc_status', 'concentration', 'conc_units', 'volume_(ul)', 'amount_(ng)', 'rin')
+    NO_INITIAL_QC = ('',) * len(INITIAL_QC_FIELDS)
+
     def __init__(self):
         self.customer_name = ''
         self.ngi_id        = ''
         self.preps         = {}
         self.qscore        = ''
         self.total_reads   = ''
-        self.initial_qc    = { 'initial_qc_status' : '',
-                                'concentration': '',
-                                'conc_units':'',
-                                'volume_(ul)': '',
-                                'amount_(ng)': '',
-                                'rin': ''
-                                }
+        self._initial_qc   = self.NO_INITIAL_QC
         self.well_location = ''
 
+    @property
+    def initial_qc(self):
+        """Initial qc values as a new dict, keyed by INITIAL_QC_FIELDS"""
+        return dict(zip(self.INITIAL_QC_FIELDS, self._initial_qc))
+
+    @initial_qc.setter
+    def initial_qc(self, qc_info):
+        self._initial_qc = tuple(qc_info.get(item) for item in self.INITIAL_QC_FIELDS)
+
+    def to_row(self):
+        """Return the sample as a dict for the sample table"""
+        return {'ngi_id': self.ngi_id, 'customer_name': self.customer_name,
+                'total_reads': self.total_reads, 'qscore': self.qscore}
+
 class Prep:
     """Prep class
     """
+    __slots__ = ('avg_size', 'barcode', 'label', 'qc_status')
+
     def __init__(self):
         self.avg_size    = 'NA'
         self.barcode     = 'NA'
         self.label       = ''
         self.qc_status   = 'NA'
 
+    def to_row(self, ngi_id):
+        """Return the prep as a dict for the library table
+        :param str ngi_id: NGI id of the sample the prep belongs to
+        """
+        return {'ngi_id': ngi_id, 'barcode': self.barcode, 'label': self.label,
+                'avg_size': self.avg_size, 'qc_status': self.qc_status}
+
 class Flowcell:
     """Flowcell class
     """
+    __slots__ = ('date', 'lanes', 'name', 'run_name', 'run_setup', 'seq_meth', 'type',
+                 'run_params', 'chemistry', 'casava', 'seq_software')
+
     def __init__(self):
         self.date      = ''
         self.lanes     = OrderedDict()
@@ -52,42 +76,92 @@ class Flowcell:
         self.casava = None
         self.seq_software = {}
 
+    def lane_rows(self):
+        """Return the lanes as dicts for the lanes table"""
+        return [lane.to_row(self) for lane in self.lanes.values()]
+
 class Lane:
     """Lane class
     """
+    __slots__ = ('avg_qval', 'cluster', 'id', 'phix')
+
     def __init__(self):
         self.avg_qval = ''
         self.cluster  = ''
         self.id       = ''
         self.phix     = ''
 
-    def set_lane_info(self, to_set, key, lane_info, reads, as_million=False):
-        """Set the average value of gives key from given lane info
-        :param str to_set: class parameter to be set
-        :param str key: key to be fetched
-        :param dict lane_info: a dictionary with required lane info
-        :param str reads: number of reads for keys to be fetched
+    def to_row(self, fc):
+        """Return the lane as a dict for the lanes table, with the metrics formatted
+        :param Flowcell fc: flowcell the lane belongs to
         """
-        try:
-            v = np.mean([float(lane_info.get('{} R{}'.format(key, str(r)))) for r in range(1,int(reads)+1)])
-            val = '{:.2f}'.format(round(v/1000000, 2)) if as_million else '{:.2f}'.format(round(v, 2))
-        except TypeError:
-            val = None
-
-        if to_set == 'cluster':
-            self.cluster = val
-        elif to_set == 'avg_qval':
-            self.avg_qval = val
-        elif to_set == 'fc_phix':
-            self.phix = val
+        return {'date': fc.date, 'name': fc.name, 'id': self.id, 'cluster': lane_metrics.format_metric(self.cluster),
+                'phix': lane_metrics.format_metric(self.phix), 'avg_qval': lane_metrics.format_metric(self.avg_qval),
+                'seq_meth': fc.seq_meth}
 
 class AbortedSampleInfo:
     """Aborted Sample info class
     """
+    __slots__ = ('status', 'user_id')
+
     def __init__(self, user_id, status):
         self.status = status
         self.user_id = user_id
 
+class QualityRecords:
+    """Quality records of samples, one per lane and barcode of a flowcell, kept
+    as columns so they can be aggregated per sample with numpy
+    """
+    def __init__(self):
+        self.samples = []
+        self.qvals   = []
+        self.reads   = []
+        self.bases   = []
+        self._index  = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, sample, key, qval, reads, bases):
+        """Add a record, replacing the values of an earlier record of the sample with the same key
+        :param str sample: sample the record belongs to
+        :param tuple key: identifier of the record, e.g. (lane, flowcell, barcode)
+        """
+        idx = self._index.setdefault((sample, key), len(self.samples))
+        if idx == len(self.samples):
+            self.samples.append(sample)
+            self.qvals.append(qval)
+            self.reads.append(reads)
+            self.bases.append(bases)
+        else:
+            self.qvals[idx], self.reads[idx], self.bases[idx] = qval, reads, bases
+
+    def extend(self, other):
+        """Add all records of another QualityRecords, e.g. the ones of another flowcell"""
+        if self._index.keys().isdisjoint(other._index):
+            offset = len(self.samples)
+            self._index.update((k, idx + offset) for k, idx in other._index.items())
+            self.samples.extend(other.samples)
+            self.qvals.extend(other.qvals)
+            self.reads.extend(other.reads)
+            self.bases.extend(other.bases)
+        else:
+            for (sample, key), idx in other._index.items():
+                self.add(sample, key, other.qvals[idx], other.reads[idx], other.bases[idx])
+
+    def sample_totals(self):
+        """Return the sorted sample names, their Q30 averaged over the bases and
+        their total reads, as numpy arrays. The records of a sample are summed in
+        the order they were added.
+        """
+        names, codes = np.unique(np.array(self.samples, dtype=str), return_inverse=True)
+        bases = np.array(self.bases, dtype=float)
+        qvalsbp = np.bincount(codes, weights=np.array(self.qvals, dtype=float) * bases, minlength=len(names))
+        total_bases = np.bincount(codes, weights=bases, minlength=len(names))
+        total_reads = np.bincount(codes, weights=np.array(self.reads, dtype=float), minlength=len(names))
+        avg_qvals = np.divide(qvalsbp, total_bases, out=qvalsbp.astype(float), where=total_bases != 0)
+        return names, avg_qvals, total_reads
+
 class Project:
     """Project class
     """
@@ -137,10 +211,30 @@ class Project:
             sys.exit('A project was not provided, stopping execution...')
         self.skip_fastq = kwargs.get('skip_fastq')
         self.cluster = kwargs.get('cluster')
-
-        pcon = statusdb.ProjectSummaryConnection()
+        sample_selector = sample_selection.SampleSelector(kwargs.get('samples'), kwargs.get('samples_file'))
+
+        connections = kwargs.get('statusdb_connections')
+        if not connections:
+            backend = statusdb_fixtures.get_backend(record=kwargs.get('record_statusdb'), replay=kwargs.get('replay_statusdb'))
+            connections = statusdb.ReportConnections(lazy=not kwargs.get('preload_views'), snapshot=not kwargs.get('no_view_snapshot'),
+                                                     log=log, backend=backend)
+        pcon = connections.projects
         assert pcon, 'Could not connect to {} database in StatusDB'.format('project')
 
+        ## use the cached project if none of the documents it was populated from changed,
+        ## never when recording as nothing would be recorded then
+        cache = None
+        if not kwargs.get('no_project_cache') and not kwargs.get('record_statusdb'):
+            cache_options = {opt: kwargs.get(opt) for opt in project_cache.PROJECT_OPTIONS}
+            cache_options['organism_names'] = dict(organism_names)
+            cache_options['samples'] = sample_selector.key()
+            cache = project_cache.ProjectCache(connections, project, cache_options, log=log)
+            with profiling.span('load project cache'):
+                state = cache.load()
+            if state:
+                vars(self).update(state)
+                return
+
         if re.match('^P\d+$', project):
             self.ngi_id = project
             id_view, pid_as_uppmax_dest = (True, True)
@@ -148,7 +242,8 @@ class Project:
             self.ngi_name = project
             id_view, pid_as_uppmax_dest = (False, False)
 
-        proj = pcon.get_entry(project, use_id_view=id_view)
+        with profiling.span('fetch project document'):
+            proj = pcon.get_entry(project, use_id_view=id_view)
         if not proj:
             log.error('No such project name/id "{}", check if provided information is right'.format(project))
             sys.exit('Project not found in statusdb, stopping execution...')
@@ -203,7 +298,7 @@ class Project:
         self.sequencing_setup = proj_details.get('sequencing_setup')
 
         for sample_id, sample in sorted(proj.get('samples', {}).items()):
-            if kwargs.get('samples', []) and sample_id not in kwargs.get('samples', []):
+            if not sample_selector.selects(sample_id):
                 log.info('Will not include sample {} as it is not in given list'.format(sample_id))
                 continue
 
@@ -226,8 +321,7 @@ class Project:
             ## Basic fields from Project database
             # Initial qc
             if sample.get('initial_qc'):
-                for item in samObj.initial_qc:
-                    samObj.initial_qc[item] = sample['initial_qc'].get(item)
+                samObj.initial_qc = sample['initial_qc']
 
             #Library prep
             ## get total reads if available or mark sample as not sequenced
@@ -269,167 +363,75 @@ class Project:
             self.samples[sample_id] = samObj
 
         #Get Flowcell data
-        fcon = statusdb.FlowcellRunMetricsConnection()
+        fcon = connections.flowcells
         assert fcon, 'Could not connect to {} database in StatusDB'.format('flowcell')
-        xcon = statusdb.X_FlowcellRunMetricsConnection()
+        xcon = connections.x_flowcells
         assert xcon, 'Could not connect to {} database in StatusDB'.format('x_flowcells')
-        flowcell_info = fcon.get_project_flowcell(self.ngi_id, self.dates['open_date'])
-        flowcell_info.update(xcon.get_project_flowcell(self.ngi_id, self.dates['open_date']))
-
-        sample_qval = defaultdict(dict)
-
-        for fc in list(flowcell_info.values()):
-            if fc['name'] in kwargs.get('exclude_fc'):
-                continue
-            fcObj           = Flowcell()
-            fcObj.name      = fc['name']
-            fcObj.run_name  = fc['run_name']
-            fcObj.date      = fc['date']
-
-            # get database document from appropriate database
-            if fc['db'] == 'x_flowcells':
-                fc_details = xcon.get_entry(fc['run_name'])
-            else:
-                fc_details = fcon.get_entry(fc['run_name'])
-
-            # set the fc type
-            fc_inst = fc_details.get('RunInfo', {}).get('Instrument','')
-            if fc_inst.startswith('ST-'):
-                fcObj.type = 'HiSeqX'
-                self.is_hiseqx = True
-                fc_runp = fc_details.get('RunParameters',{}).get('Setup',{})
-            elif '-' in fcObj.name :
-                fcObj.type = 'MiSeq'
-                fc_runp = fc_details.get('RunParameters',{})
-            elif fc_inst.startswith('A'):
-                fcObj.type = 'NovaSeq6000'
-                fc_runp = fc_details.get('RunParameters',{})
-            elif fc_inst.startswith('NS'):
-                fcObj.type = 'NextSeq500'
-                fc_runp = fc_details.get('RunParameters',{})
-            elif fc_inst.startswith('VH'):
-                fcObj.type = 'NextSeq2000'
-                fc_runp = fc_details.get('RunParameters',{})
-            else:
-                fcObj.type = 'HiSeq2500'
-                fc_runp = fc_details.get('RunParameters',{}).get('Setup',{})
-
-            ## Fetch run setup for the flowcell
-            fcObj.run_setup = fc_details.get('RunInfo').get('Reads')
-
-            if fcObj.type == 'NovaSeq6000':
-                fcObj.chemistry = {'WorkflowType' : fc_runp.get('WorkflowType'), 'FlowCellMode' : fc_runp.get('RfidsInfo', {}).get('FlowCellMode')}
-            elif fcObj.type == 'NextSeq500':
-                fcObj.chemistry = {'Chemistry':  fc_runp.get('Chemistry').replace('NextSeq ', '')}
-            elif fcObj.type == 'NextSeq2000':
-                NS2000_FC_PAT = re.compile("P[2,3]")
-                fcObj.chemistry = {'Chemistry':  NS2000_FC_PAT.findall(fc_runp.get('FlowCellMode'))[0]}
-            else:
-                fcObj.chemistry = {'Chemistry' : fc_runp.get('ReagentKitVersion', fc_runp.get('Sbs'))}
-
-            try:
-                fcObj.casava = list(fc_details['DemultiplexConfig'].values())[0]['Software']['Version']
-            except (KeyError, IndexError):
-                continue
-
-            if fcObj.type == 'MiSeq':
-                fcObj.seq_software = {'RTAVersion': fc_runp.get('RTAVersion'),
-                                        'ApplicationVersion': fc_runp.get('MCSVersion')
-                                        }
-            elif fcObj.type == 'NextSeq500' or fcObj.type == 'NextSeq2000':
-                fcObj.seq_software = {'RTAVersion': fc_runp.get('RTAVersion', fc_runp.get('RtaVersion')),
-                                        'ApplicationName': fc_runp.get('ApplicationName') if fc_runp.get('ApplicationName') else fc_runp.get('Setup').get('ApplicationName'),
-                                        'ApplicationVersion': fc_runp.get('ApplicationVersion') if fc_runp.get('ApplicationVersion') else fc_runp.get('Setup').get('ApplicationVersion')
-                                        }
-            else:
-                fcObj.seq_software = {'RTAVersion': fc_runp.get('RTAVersion', fc_runp.get('RtaVersion')),
-                                        'ApplicationName': fc_runp.get('ApplicationName', fc_runp.get('Application')),
-                                        'ApplicationVersion': fc_runp.get('ApplicationVersion')
-                                        }
-
-            ## Collect quality info for samples and collect lanes of interest
-            for stat in fc_details.get('illumina',{}).get('Demultiplex_Stats',{}).get('Barcode_lane_statistics',[]):
-
-                if re.sub('_+','.',stat['Project'],1) != self.ngi_name and stat['Project'] != self.ngi_name:
+        with profiling.span('find project flowcells'):
+            flowcell_info = fcon.get_project_flowcell(self.ngi_id, self.dates['open_date'])
+            flowcell_info.update(xcon.get_project_flowcell(self.ngi_id, self.dates['open_date']))
+
+        # get database documents in bulk from appropriate database, and parse them
+        # on a thread pool if more than one worker is asked for
+        workers = kwargs.get('workers') or 1
+        fcs = [fc for fc in flowcell_info.values() if fc['name'] not in kwargs.get('exclude_fc')]
+        batch_size = kwargs.get('fc_batch_size') or statusdb.DEFAULT_BATCH_SIZE
+        if workers > 1 and not kwargs.get('fc_batch_size'):
+            batch_size = min(batch_size, max(-(-len(fcs) // workers), 1))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fc_docs = {}
+            for con in (fcon, xcon):
+                run_names = [fc['run_name'] for fc in fcs if fc['db'] == con.db.name]
+                fetch_opts = {'batch_size': batch_size, 'executor': executor if workers > 1 else None}
+                with profiling.span('fetch flowcell documents {}'.format(con.db.name)):
+                    entries = con.get_project_entries(self.ngi_name, run_names, **fetch_opts) if kwargs.get('projected_fetch') and run_names else None
+                    if entries is None and kwargs.get('stream_fc_docs'):
+                        entries = con.stream_project_entries(self.ngi_name, run_names, **fetch_opts)
+                    if entries is None:
+                        entries = con.get_entries(run_names, **fetch_opts)
+                for run_name, doc in entries.items():
+                    fc_docs[(con.db.name, run_name)] = doc
+
+            # parsed on the pool's threads, so the spans are put under this thread's span explicitly
+            span_path = profiling.PROFILER.current_path()
+            def parse(fc):
+                with profiling.span('parse flowcell {}'.format(fc['name']), parent=span_path):
+                    return self.parse_flowcell(log, fc, fc_docs.get((fc['db'], fc['run_name'])), sample_selector=sample_selector, **kwargs)
+            parsed_fcs = executor.map(parse, fcs) if workers > 1 else map(parse, fcs)
+
+            ## merge the per flowcell results in the flowcell order, same as a sequential run
+            sample_qval = QualityRecords()
+            for fcObj, fc_sample_qval in parsed_fcs:
+                if fcObj is None:
                     continue
-
-                lane = stat.get('Lane')
-                if fc['db'] == 'x_flowcells':
-                    sample = stat.get('Sample')
-                    barcode = stat.get('Barcode sequence')
-                    qval_key, base_key = ('% >= Q30bases', 'PF Clusters')
-
-                else:
-                    sample = stat.get('Sample ID')
-                    barcode = stat.get('Index')
-                    qval_key, base_key = ('% of >= Q30 Bases (PF)', '# Reads')
-
-                #skip if there are no lanes or samples
-                if not lane or not sample or not barcode:
-                    log.warn('Insufficient info/malformed data in Barcode_lane_statistics in FC {}, skipping...'.format(fcObj.name))
-                    continue
-
-                if kwargs.get('samples', []) and sample not in kwargs.get('samples', []):
+                if fcObj.type == 'HiSeqX':
+                    self.is_hiseqx = True
+                if fc_sample_qval is None:
                     continue
-
-                try:
-                    r_idx = '{}_{}_{}'.format(lane, fcObj.name, barcode)
-                    r_len_list = [x['NumCycles'] for x in fcObj.run_setup if x['IsIndexedRead'] == 'N']
-                    r_len_list = [int(x) for x in r_len_list]
-                    r_num = len(r_len_list)
-                    qval = float(stat.get(qval_key))
-                    pfrd = int(stat.get(base_key).replace(',',''))
-                    pfrd = pfrd/2 if fc['db'] == 'flowcell' else pfrd
-                    base = pfrd * sum(r_len_list)
-                    sample_qval[sample][r_idx] = {'qval': qval, 'reads': pfrd, 'bases': base}
-
-                except (TypeError, ValueError, AttributeError) as e:
-                    log.warn('Something went wrong while fetching Q30 for sample {} with barcode {} in FC {} at lane {}'.format(sample, barcode, fcObj.name, lane))
-                    pass
-                ## collect lanes of interest to proceed later
-                fc_lane_summary = fc_details.get('lims_data', {}).get('run_summary', {})
-                if lane not in fcObj.lanes:
-                    laneObj = Lane()
-                    lane_sum = fc_lane_summary.get(lane, fc_lane_summary.get('A',{}))
-                    laneObj.id = lane
-                    laneObj.set_lane_info('cluster', 'Reads PF (M)' if 'NovaSeq' in fcObj.type or 'NextSeq' in fcObj.type else 'Clusters PF', lane_sum,
-                                                str(r_num), False if 'NovaSeq' in fcObj.type or 'NextSeq' in fcObj.type else True)
-                    laneObj.set_lane_info('avg_qval', '% Bases >=Q30', lane_sum, str(r_num))
-                    laneObj.set_lane_info('fc_phix', '% Error Rate', lane_sum, str(r_num))
-                    if kwargs.get('fc_phix',{}).get(fcObj.name, {}):
-                        laneObj.phix = kwargs.get('fc_phix').get(fcObj.name).get(lane)
-
-                    fcObj.lanes[lane] = laneObj
-
-                    ## Check if the above created lane object has all needed info
-                    for k,v in vars(laneObj).items():
-                        if not v:
-                            log.warn('Could not fetch {} for FC {} at lane {}'.format(k, fcObj.name, lane))
-
-            self.flowcells[fcObj.name] = fcObj
+                sample_qval.extend(fc_sample_qval)
+                self.flowcells[fcObj.name] = fcObj
+                log.debug('Processed FC {}, process peak RSS so far {} MB'.format(fcObj.name, profiling.format_mb(profiling.peak_rss_mb())))
 
         if not self.flowcells:
             log.warn('There is no flowcell to process for project {}'.format(self.ngi_name))
             self.missing_fc = True
 
 
-        if sample_qval and kwargs.get('yield_from_fc'):
+        ## calculate average Q30 and total reads over all lanes and flowcells
+        with profiling.span('aggregate sample quality'):
+            seq_samples, avg_qvals, sample_reads = sample_qval.sample_totals()
+
+        if len(seq_samples) and kwargs.get('yield_from_fc'):
             log.info('\'yield_from_fc\' option was given so will compute the yield from collected flowcells')
+            seq_sample_set = set(seq_samples.tolist())
             for sample in list(self.samples.keys()):
-                if sample not in list(sample_qval.keys()):
+                if sample not in seq_sample_set:
                     del self.samples[sample]
 
-        ## calculate average Q30 over all lanes and flowcell
         max_total_reads = 0
-        for sample in sorted(sample_qval.keys()):
+        for sample, avg_qval, total_reads in zip(seq_samples.tolist(), avg_qvals.tolist(), sample_reads.tolist()):
             try:
-                qinfo = sample_qval[sample]
-                total_qvalsbp, total_bases, total_reads = (0, 0, 0)
-                for k in qinfo:
-                    total_qvalsbp += qinfo[k]['qval'] * qinfo[k]['bases']
-                    total_bases += qinfo[k]['bases']
-                    total_reads += qinfo[k]['reads']
-                avg_qval = float(total_qvalsbp)/total_bases if total_bases else float(total_qvalsbp)
                 self.samples[sample].qscore = '{:.2f}'.format(round(avg_qval, 2))
                 ## Get/overwrite yield from the FCs computed instead of statusDB value
                 if total_reads:
@@ -453,8 +455,30 @@ class Project:
         for sample in self.samples:
             self.samples[sample].total_reads = '{:.2f}'.format(self.samples[sample].total_reads/float(samples_divisor))
 
+        if cache:
+            with profiling.span('save project cache'):
+                cache.save(vars(self), proj, flowcell_info, {(fc['db'], fc['run_name']): fc_docs.get((fc['db'], fc['run_name'])) for fc in fcs})
+
 
 
+    def parse_flowcell(self, log, fc, fc_details, sample_selector=None, **kwargs):
+        """Parse a flowcell document into a Flowcell object and collect the quality
+        info of this project's samples in it, with the parser for the instrument
+        of the flowcell. Does not modify the project, so it can be run concurrently
+        for different flowcells.
+
+        :param logger log: a logger instance to log information when neccesary
+        :param dict fc: flowcell info as given by get_project_flowcell
+        :param dict fc_details: flowcell document from StatusDB
+        :param SampleSelector sample_selector: samples to collect the quality info of, from the options if not given
+        :return: the Flowcell object, or None if there is no document, and the
+                 QualityRecords of the samples, or None if the flowcell should not be included
+        """
+        if sample_selector is None:
+            sample_selector = sample_selection.SampleSelector(kwargs.get('samples'), kwargs.get('samples_file'))
+        return flowcell_parsers.parse_flowcell(log, fc, fc_details, self.ngi_name,
+                                               samples=sample_selector, fc_phix=kwargs.get('fc_phix'))
+
     def get_library_method(self, project_name, application, library_construction_method, library_prep_option):
         """Get the library construction method and return as formatted string
         """
@@ -0,0 +1,257 @@
+""" Parsers of flowcell documents, one per instrument type. A parser works out
+everything that is the same for all the lane statistics of a flowcell once, so
+the statistics themselves can be run through a tight loop.
+"""
+import re
+
+from ngi_reports.utils import entities, lane_metrics, sample_selection
+
+NS2000_FC_PAT = re.compile("P[2,3]")
+
+# keys of sample, barcode, Q30 and reads in Barcode_lane_statistics, which differ between the databases
+STAT_KEYS = {'x_flowcells': ('Sample', 'Barcode sequence', '% >= Q30bases', 'PF Clusters')}
+DEFAULT_STAT_KEYS = ('Sample ID', 'Index', '% of >= Q30 Bases (PF)', '# Reads')
+
+PARSERS = []
+
+def register(parser_cls):
+    """Class decorator to add a parser to the registry, the first registered
+    parser that handles a flowcell is used for it
+    """
+    PARSERS.append(parser_cls)
+    return parser_cls
+
+def get_parser(fc_inst, fc_name):
+    """Return the parser class for a flowcell
+
+    :param str fc_inst: instrument id from the RunInfo of the flowcell
+    :param str fc_name: name of the flowcell
+    """
+    for parser_cls in PARSERS:
+        if parser_cls.handles(fc_inst, fc_name):
+            return parser_cls
+
+def parse_flowcell(log, fc, fc_details, project_name, samples=None, fc_phix=None):
+    """Parse a flowcell document with the parser of its instrument type
+
+    :param logger log: a logger instance to log information when neccesary
+    :param dict fc: flowcell info as given by get_project_flowcell
+    :param dict fc_details: flowcell document from StatusDB
+    :param str project_name: NGI name of the project to collect the statistics of
+    :param samples: SampleSelector or list of the samples to collect the statistics of, all if not given
+    :param dict fc_phix: phix values to use per flowcell and lane
+    :return: the Flowcell object, or None if there is no document, and the
+             QualityRecords of the samples, or None if the flowcell should not be included
+    """
+    if not fc_details:
+        log.warn('Could not fetch the document for FC {} from {}, skipping...'.format(fc['run_name'], fc['db']))
+        return None, entities.QualityRecords()
+    fc_inst = fc_details.get('RunInfo', {}).get('Instrument','')
+    parser = get_parser(fc_inst, fc['name'])(log, fc, fc_details, project_name, samples=samples, fc_phix=fc_phix)
+    return parser.parse()
+
+
+class FlowcellParser(object):
+    """Base class of the flowcell parsers, the defaults are the ones of HiSeq runs
+
+    :param logger log: a logger instance to log information when neccesary
+    :param dict fc: flowcell info as given by get_project_flowcell
+    :param dict fc_details: flowcell document from StatusDB
+    :param str project_name: NGI name of the project to collect the statistics of
+    :param samples: SampleSelector or list of the samples to collect the statistics of, all if not given
+    :param dict fc_phix: phix values to use per flowcell and lane
+    """
+    fc_type = None
+    # whether the interesting run parameters are under RunParameters.Setup
+    params_in_setup = False
+
+    def __init__(self, log, fc, fc_details, project_name, samples=None, fc_phix=None):
+        self.log = log
+        self.fc = fc
+        self.fc_details = fc_details
+        self.project_name = project_name
+        if samples is not None and not isinstance(samples, sample_selection.SampleSelector):
+            samples = sample_selection.SampleSelector(samples)
+        self.samples = samples if samples else None
+        self.fc_phix = (fc_phix or {}).get(fc['name'], {})
+        self.sample_key, self.barcode_key, self.qval_key, self.base_key = STAT_KEYS.get(fc['db'], DEFAULT_STAT_KEYS)
+        self.lane_summary = fc_details.get('lims_data', {}).get('run_summary', {})
+        self._project_matches = {}
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        """Return True if this parser is for the given flowcell"""
+        return False
+
+    def run_params(self):
+        run_params = self.fc_details.get('RunParameters',{})
+        return run_params.get('Setup',{}) if self.params_in_setup else run_params
+
+    def chemistry(self, fc_runp):
+        return {'Chemistry' : fc_runp.get('ReagentKitVersion', fc_runp.get('Sbs'))}
+
+    def seq_software(self, fc_runp):
+        return {'RTAVersion': fc_runp.get('RTAVersion', fc_runp.get('RtaVersion')),
+                'ApplicationName': fc_runp.get('ApplicationName', fc_runp.get('Application')),
+                'ApplicationVersion': fc_runp.get('ApplicationVersion')
+                }
+
+    def is_project(self, stat_project):
+        """Return True if the project of a stat row is this project, which can
+        be written with underscores instead of the first dot of the name
+        """
+        match = self._project_matches.get(stat_project)
+        if match is None:
+            match = stat_project == self.project_name or re.sub('_+', '.', stat_project, 1) == self.project_name
+            self._project_matches[stat_project] = match
+        return match
+
+    def parse(self):
+        """Parse the flowcell document, see parse_flowcell for the returned values"""
+        sample_qval = entities.QualityRecords()
+        fcObj           = entities.Flowcell()
+        fcObj.name      = self.fc['name']
+        fcObj.run_name  = self.fc['run_name']
+        fcObj.date      = self.fc['date']
+        fcObj.type      = self.fc_type
+
+        fc_runp = self.run_params()
+        ## Fetch run setup for the flowcell
+        fcObj.run_setup = self.fc_details.get('RunInfo').get('Reads')
+        fcObj.chemistry = self.chemistry(fc_runp)
+
+        try:
+            fcObj.casava = list(self.fc_details['DemultiplexConfig'].values())[0]['Software']['Version']
+        except (KeyError, IndexError):
+            return fcObj, None
+
+        fcObj.seq_software = self.seq_software(fc_runp)
+        self.parse_stats(fcObj, sample_qval)
+        return fcObj, sample_qval
+
+    def parse_stats(self, fcObj, sample_qval):
+        """Collect quality info for samples and the lanes of interest"""
+        stats = self.fc_details.get('illumina',{}).get('Demultiplex_Stats',{}).get('Barcode_lane_statistics',[])
+        try:
+            read_lengths = [int(x['NumCycles']) for x in fcObj.run_setup if x['IsIndexedRead'] == 'N']
+        except (TypeError, ValueError, KeyError):
+            if stats:
+                self.log.warn('Could not get the read lengths of FC {}, skipping its lane statistics...'.format(fcObj.name))
+            return
+        read_length = sum(read_lengths)
+        metrics = lane_metrics.compute_lane_metrics(self.lane_summary, len(read_lengths), self.fc_type)
+        no_metrics = dict.fromkeys(attr for attr, key, divisor in lane_metrics.LANE_METRICS)
+
+        is_project, samples, lanes = self.is_project, self.samples, fcObj.lanes
+        sample_key, barcode_key, qval_key, base_key = self.sample_key, self.barcode_key, self.qval_key, self.base_key
+        for stat in stats:
+            if not is_project(stat['Project']):
+                continue
+
+            lane = stat.get('Lane')
+            sample = stat.get(sample_key)
+            barcode = stat.get(barcode_key)
+            #skip if there are no lanes or samples
+            if not lane or not sample or not barcode:
+                self.log.warn('Insufficient info/malformed data in Barcode_lane_statistics in FC {}, skipping...'.format(fcObj.name))
+                continue
+
+            if samples and sample not in samples:
+                continue
+
+            try:
+                qval = float(stat.get(qval_key))
+                pfrd = int(stat.get(base_key).replace(',',''))
+                sample_qval.add(sample, (lane, fcObj.name, barcode), qval, pfrd, pfrd * read_length)
+            except (TypeError, ValueError, AttributeError):
+                self.log.warn('Something went wrong while fetching Q30 for sample {} with barcode {} in FC {} at lane {}'.format(sample, barcode, fcObj.name, lane))
+
+            ## collect lanes of interest to proceed later
+            if lane not in lanes:
+                lanes[lane] = self.make_lane(fcObj, lane, metrics.get(lane, metrics.get('A', no_metrics)))
+
+    def make_lane(self, fcObj, lane, metrics):
+        laneObj = entities.Lane()
+        laneObj.id = lane
+        for attr, value in metrics.items():
+            setattr(laneObj, attr, value)
+        if self.fc_phix:
+            laneObj.phix = self.fc_phix.get(lane)
+
+        ## Check if the above created lane object has all needed info
+        for k in laneObj.__slots__:
+            if getattr(laneObj, k) in (None, ''):
+                self.log.warn('Could not fetch {} for FC {} at lane {}'.format(k, fcObj.name, lane))
+        return laneObj
+
+
+@register
+class HiSeqXParser(FlowcellParser):
+    fc_type = 'HiSeqX'
+    params_in_setup = True
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return fc_inst.startswith('ST-')
+
+@register
+class MiSeqParser(FlowcellParser):
+    fc_type = 'MiSeq'
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return '-' in fc_name
+
+    def seq_software(self, fc_runp):
+        return {'RTAVersion': fc_runp.get('RTAVersion'),
+                'ApplicationVersion': fc_runp.get('MCSVersion')
+                }
+
+@register
+class NovaSeq6000Parser(FlowcellParser):
+    fc_type = 'NovaSeq6000'
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return fc_inst.startswith('A')
+
+    def chemistry(self, fc_runp):
+        return {'WorkflowType' : fc_runp.get('WorkflowType'), 'FlowCellMode' : fc_runp.get('RfidsInfo', {}).get('FlowCellMode')}
+
+@register
+class NextSeq500Parser(FlowcellParser):
+    fc_type = 'NextSeq500'
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return fc_inst.startswith('NS')
+
+    def chemistry(self, fc_runp):
+        return {'Chemistry':  fc_runp.get('Chemistry').replace('NextSeq ', '')}
+
+    def seq_software(self, fc_runp):
+        return {'RTAVersion': fc_runp.get('RTAVersion', fc_runp.get('RtaVersion')),
+                'ApplicationName': fc_runp.get('ApplicationName') if fc_runp.get('ApplicationName') else fc_runp.get('Setup').get('ApplicationName'),
+                'ApplicationVersion': fc_runp.get('ApplicationVersion') if fc_runp.get('ApplicationVersion') else fc_runp.get('Setup').get('ApplicationVersion')
+                }
+
+@register
+class NextSeq2000Parser(NextSeq500Parser):
+    fc_type = 'NextSeq2000'
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return fc_inst.startswith('VH')
+
+    def chemistry(self, fc_runp):
+        return {'Chemistry':  NS2000_FC_PAT.findall(fc_runp.get('FlowCellMode'))[0]}
+
+@register
+class HiSeq2500Parser(FlowcellParser):
+    """Fallback for all flowcells not handled by any other parser"""
+    fc_type = 'HiSeq2500'
+    params_in_setup = True
+
+    @staticmethod
+    def handles(fc_inst, fc_name):
+        return True
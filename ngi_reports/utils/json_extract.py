@@ -0,0 +1,93 @@
+""" Extract selected parts of large JSON texts, without decoding the parts
+that are not needed into python objects
+"""
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+def extract(text, spec):
+    """Decode the parts of a JSON text described by spec. A spec is either
+
+    * True, to decode the value as is
+    * a dict of key -> spec, to only decode the given keys of an object
+    * a list with one spec, to decode each element of an array with that spec
+    * a callable, to only keep the elements of an array it returns True for
+
+    :param str text: JSON text
+    :param spec: spec of the parts to decode
+    """
+    value, pos = _extract_value(text, _skip_whitespace(text, 0), spec)
+    return value
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+def _skip_value(text, pos):
+    """Return the position after the value starting at pos, without decoding it"""
+    if text[pos] not in '{[':
+        return _decoder.raw_decode(text, pos)[1]
+    depth = 0
+    for token in _TOKENS.finditer(text, pos):
+        t = token.group()
+        if t == '{' or t == '[':
+            depth += 1
+        elif t == '}' or t == ']':
+            depth -= 1
+            if depth == 0:
+                return token.end()
+    raise ValueError('Unterminated JSON value starting at {}'.format(pos))
+
+def _extract_value(text, pos, spec):
+    if spec is True:
+        return _decoder.raw_decode(text, pos)
+    if isinstance(spec, dict) and text[pos] == '{':
+        return _extract_object(text, pos, spec)
+    if (isinstance(spec, list) or callable(spec)) and text[pos] == '[':
+        return _extract_array(text, pos, spec)
+    # not the expected type, so take the value as it is
+    return _decoder.raw_decode(text, pos)
+
+def _extract_object(text, pos, spec):
+    obj = {}
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos] == '}':
+        return obj, pos + 1
+    while True:
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip_whitespace(text, pos)
+        if text[pos] != ':':
+            raise ValueError('Expecting \':\' delimiter at {}'.format(pos))
+        pos = _skip_whitespace(text, pos + 1)
+        if key in spec:
+            obj[key], pos = _extract_value(text, pos, spec[key])
+        else:
+            pos = _skip_value(text, pos)
+        pos = _skip_whitespace(text, pos)
+        if text[pos] == '}':
+            return obj, pos + 1
+        if text[pos] != ',':
+            raise ValueError('Expecting \',\' delimiter at {}'.format(pos))
+        pos = _skip_whitespace(text, pos + 1)
+
+def _extract_array(text, pos, spec):
+    arr = []
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos] == ']':
+        return arr, pos + 1
+    while True:
+        if isinstance(spec, list):
+            element, pos = _extract_value(text, pos, spec[0])
+            arr.append(element)
+        else:
+            element, pos = _decoder.raw_decode(text, pos)
+            if spec(element):
+                arr.append(element)
+        pos = _skip_whitespace(text, pos)
+        if text[pos] == ']':
+            return arr, pos + 1
+        if text[pos] != ',':
+            raise ValueError('Expecting \',\' delimiter at {}'.format(pos))
+        pos = _skip_whitespace(text, pos + 1)
@@ -0,0 +1,49 @@
+""" Compute the lane metrics shown in the reports from the lane summary
+(lims_data.run_summary) of a flowcell
+"""
+
+# Lane attribute, key in the lane summary (one value per read, e.g. 'Clusters PF R1')
+# and divisor to get the value to report
+LANE_METRICS = (('cluster', 'Clusters PF', 1000000),
+                ('avg_qval', '% Bases >=Q30', 1),
+                ('phix', '% Error Rate', 1))
+
+# Metrics given differently in the lane summary of some flowcell types,
+# NovaSeq and NextSeq runs have the clusters as reads in millions
+TYPE_METRICS = {fc_type: {'cluster': ('Reads PF (M)', 1)} for fc_type in ('NovaSeq6000', 'NextSeq500', 'NextSeq2000')}
+
+def get_metrics(fc_type):
+    """Return the (attribute, key, divisor) of the lane metrics for a flowcell type"""
+    type_metrics = TYPE_METRICS.get(fc_type, {})
+    return [(attr,) + type_metrics.get(attr, (key, divisor)) for attr, key, divisor in LANE_METRICS]
+
+def compute_lane_metrics(run_summary, reads, fc_type):
+    """Compute the metrics of all lanes of a flowcell in one pass over its lane summary
+
+    :param dict run_summary: lane summary of the flowcell, keyed by lane ('A' for all lanes of some runs)
+    :param int reads: number of (non index) reads of the run, the metrics are averaged over them
+    :param str fc_type: type of the flowcell, e.g. 'NovaSeq6000'
+    :return: dict of lane -> dict of attribute -> value, None where the value is missing
+    """
+    metrics = get_metrics(fc_type)
+    read_keys = [(attr, ['{} R{}'.format(key, r) for r in range(1, reads + 1)], divisor) for attr, key, divisor in metrics]
+    lane_metrics = {}
+    for lane, lane_info in run_summary.items():
+        values = {}
+        for attr, keys, divisor in read_keys:
+            try:
+                values[attr] = sum(float(lane_info.get(k)) for k in keys) / len(keys) / divisor
+            except (TypeError, ValueError, ZeroDivisionError):
+                values[attr] = None
+        lane_metrics[lane] = values
+    return lane_metrics
+
+def format_metric(value):
+    """Format a lane metric for the reports with two decimals, values that are
+    not computed numbers (e.g. missing, or PhiX given on the command line) are
+    left as they are
+    """
+    if isinstance(value, float):
+        # rounded the way numpy.round does, scaled and then half to even, as the reports always were
+        return '{:.2f}'.format(round(value * 100, 0) / 100)
+    return value
@@ -0,0 +1,135 @@
+""" Lightweight spans to profile the phases of a report run, recording the wall
+time, StatusDB requests and bytes received of each phase, and the peak memory
+the process had reached by the end of it
+"""
+import json
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not reported there
+    resource = None
+
+DEFAULT_PROFILE_FILE = 'ngi_reports_profile.json'
+PATH_SEP = ' > '
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process so far in MB, None
+    if it can not be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+def format_mb(value):
+    """Format a size in MB as given by peak_rss_mb, '-' if not measured"""
+    return '-' if value is None else '{:.1f}'.format(value)
+
+
+class Profiler(object):
+    """Collects spans, timed phases named by their path of enclosing spans in
+    the same thread, e.g. 'populate > fetch flowcells'. Spans with the same path
+    are added up. Requests and bytes are counted process wide, so spans running
+    at the same time on other threads share them. The memory of a span is the
+    peak of the whole process so far when it ended, not of the phase alone.
+    Spans cost next to nothing while the profiler is not enabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.spans = OrderedDict()
+        self._local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def count_request(self, nbytes=0):
+        """Count a StatusDB request and the bytes of its response body, if already known"""
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += nbytes
+
+    def count_bytes(self, nbytes):
+        """Count bytes of a streamed response body"""
+        with self.lock:
+            self.bytes_received += nbytes
+
+    def current_path(self):
+        """Return the path of the innermost span open in this thread, '' if none"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else ''
+
+    @contextmanager
+    def span(self, name, parent=None):
+        """Time the enclosed block as a phase
+
+        :param str name: name of the phase
+        :param str parent: path of the enclosing span, by default the innermost
+                           span open in this thread; give it for spans run on a thread pool
+        """
+        if not self.enabled:
+            yield
+            return
+        if parent is None:
+            parent = self.current_path()
+        path = parent + PATH_SEP + name if parent else name
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        with self.lock:
+            stats = self.spans.setdefault(path, {'calls': 0, 'seconds': 0.0, 'requests': 0,
+                                                 'bytes_received': 0, 'process_peak_rss_mb_so_far': None})
+            requests, bytes_received = self.requests, self.bytes_received
+        self._local.stack.append(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.stack.pop()
+            peak = peak_rss_mb()
+            with self.lock:
+                stats['calls'] += 1
+                stats['seconds'] += seconds
+                stats['requests'] += self.requests - requests
+                stats['bytes_received'] += self.bytes_received - bytes_received
+                if peak is not None:
+                    stats['process_peak_rss_mb_so_far'] = max(stats['process_peak_rss_mb_so_far'] or 0.0, peak)
+
+    def breakdown(self):
+        """Return the spans, in the order they were first started"""
+        with self.lock:
+            return [dict(phase=path, **stats) for path, stats in self.spans.items()]
+
+    def table(self):
+        """Return the spans as a human readable table, nested phases indented"""
+        lines = ['{:<56} {:>6} {:>10} {:>9} {:>12} {:>16}'.format('phase', 'calls', 'seconds', 'requests', 'KB received', 'peak MB so far')]
+        for stats in self.breakdown():
+            depth = stats['phase'].count(PATH_SEP)
+            name = '  ' * depth + stats['phase'].rsplit(PATH_SEP, 1)[-1]
+            lines.append('{:<56} {:>6} {:>10.3f} {:>9} {:>12.1f} {:>16}'.format(
+                name[:56], stats['calls'], stats['seconds'], stats['requests'],
+                stats['bytes_received'] / 1024.0, format_mb(stats['process_peak_rss_mb_so_far'])))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Write the spans to a JSON file
+
+        :param str path: file to write to
+        """
+        with open(path, 'w') as f:
+            json.dump({'phases': self.breakdown(), 'requests': self.requests,
+                       'bytes_received': self.bytes_received, 'process_peak_rss_mb': peak_rss_mb()}, f, indent=2)
+
+
+PROFILER = Profiler()
+span = PROFILER.span
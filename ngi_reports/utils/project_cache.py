@@ -0,0 +1,150 @@
+""" Local cache of populated projects, keyed by the revisions of the StatusDB
+documents they were populated from, so a report can be regenerated without
+redoing all the StatusDB work when nothing has changed
+"""
+import functools
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from ngi_reports import __version__
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('HOME', ''), '.ngi_reports', 'project_cache')
+
+# options of populate that change the populated project, besides the sample selection
+PROJECT_OPTIONS = ('skip_fastq', 'cluster', 'yield_from_fc', 'exclude_fc', 'fc_phix')
+# bump when the layout of the cache entries changes
+CACHE_FORMAT = 2
+# modules the cached project objects are built by, entries made by other versions of them are not used
+SOURCE_MODULES = ('entities.py', 'flowcell_parsers.py', 'lane_metrics.py', 'sample_selection.py')
+
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    """Return a hash of the sources of the modules that build the cached projects"""
+    digest = hashlib.sha1()
+    for module in SOURCE_MODULES:
+        try:
+            with open(os.path.join(os.path.dirname(__file__), module), 'rb') as f:
+                digest.update(f.read())
+        # installs without the sources rely on the version and CACHE_FORMAT
+        except OSError:
+            digest.update(module.encode('utf-8'))
+    return digest.hexdigest()
+
+def clear(path=None):
+    """Remove all cached projects
+
+    :param str path: cache directory, '~/.ngi_reports/project_cache' by default
+    """
+    path = path or DEFAULT_CACHE_DIR
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+
+class ProjectCache(object):
+    """Cached populated project for one project and set of options. An entry is
+    only used if the project document, the list of flowcells of the project and
+    the flowcell documents all still have the same revisions. The revisions are
+    checked with one '_all_docs' request (without the documents) per database,
+    but finding flowcells added since the entry was made needs the flowcell
+    project lists, so a hit still pays for loading them: the changes since the
+    last run with the view snapshot, the full views without it.
+
+    :param connections: ReportConnections to check the revisions with
+    :param str project: project name or id, as given to populate
+    :param dict options: the options the populated project depends on
+    :param str path: cache directory, '~/.ngi_reports/project_cache' by default
+    :param logger log: a logger instance to log information when neccesary
+    """
+    def __init__(self, connections, project, options, path=None, log=None):
+        self.connections = connections
+        self.project = project
+        self.log = log
+        key = json.dumps([CACHE_FORMAT, __version__, source_hash(), connections.projects.backend.source, project, options],
+                         sort_keys=True, default=str)
+        self.path = os.path.join(path or DEFAULT_CACHE_DIR, '{}.pickle.gz'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+    def _flowcell_cons(self):
+        return {con.db.name: con for con in (self.connections.flowcells, self.connections.x_flowcells)}
+
+    def _project_flowcells(self, ngi_id, open_date):
+        # the flowcell project lists, not the revisions, tell if a flowcell was added
+        flowcell_info = self.connections.flowcells.get_project_flowcell(ngi_id, open_date)
+        flowcell_info.update(self.connections.x_flowcells.get_project_flowcell(ngi_id, open_date))
+        return sorted([fc['db'], fc['run_name']] for fc in flowcell_info.values())
+
+    def load(self):
+        """Return the state of the cached project, or None if there is no entry
+        or any of its documents changed
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with gzip.open(self.path, 'rb') as f:
+                entry = pickle.load(f)
+            state = entry['state']
+            doc_id, rev = entry['project_doc']
+        # entries pickled by older code can fail in many ways, they are only a cache miss
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError, KeyError) as e:
+            if self.log:
+                self.log.warn('Could not read the cached project {}, populating it again: {}'.format(self.project, e))
+            return None
+
+        unchanged = (self.connections.projects.get_revs([doc_id]) == {doc_id: rev} and
+                     self._project_flowcells(state['ngi_id'], state['dates']['open_date']) == entry['flowcells'])
+        if unchanged:
+            cons = self._flowcell_cons()
+            unchanged = all(cons[dbname].get_revs(list(revs)) == revs for dbname, revs in entry['flowcell_revs'].items() if revs)
+        if not unchanged:
+            if self.log:
+                self.log.info('StatusDB documents of project {} changed since it was cached, populating it again'.format(self.project))
+            return None
+        if self.log:
+            self.log.info('Loaded project {} from the cache, its StatusDB documents did not change'.format(self.project))
+        return state
+
+    def save(self, state, proj_doc, flowcell_info, fc_docs):
+        """Cache the state of a populated project, unless some flowcell document
+        was missing or had no revision
+
+        :param dict state: attributes of the populated project
+        :param dict proj_doc: project document the project was populated from
+        :param dict flowcell_info: the flowcells of the project as given by get_project_flowcell
+        :param dict fc_docs: (database, run name) -> document, None if missing, of each flowcell used
+        """
+        flowcell_revs = {dbname: {} for dbname in self._flowcell_cons()}
+        for (dbname, run_name), doc in fc_docs.items():
+            if not doc or '_id' not in doc or '_rev' not in doc:
+                if self.log:
+                    self.log.debug('Not caching project {}, no revision for the document of FC {}'.format(self.project, run_name))
+                return
+            flowcell_revs[dbname][doc['_id']] = doc['_rev']
+        entry = {'project_doc': (proj_doc['_id'], proj_doc['_rev']),
+                 'flowcells': sorted([fc['db'], fc['run_name']] for fc in flowcell_info.values()),
+                 'flowcell_revs': flowcell_revs,
+                 'state': state}
+
+        cache_dir = os.path.dirname(self.path)
+        tmp_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first, so concurrent runs never read half written entries
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+        except OSError as e:
+            # the cache is only an optimization, the report goes on without it
+            if self.log:
+                self.log.warn('Could not cache project {} in {}: {}'.format(self.project, cache_dir, e))
+            return
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if self.log:
+            self.log.debug('Cached project {} in {}'.format(self.project, self.path))
@@ -0,0 +1,60 @@
+""" Selection of the samples to include in a report, by sample id, glob
+pattern or regular expression
+"""
+import fnmatch
+import re
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+REGEX_PREFIX = 're:'
+
+def read_samples_file(samples_file):
+    """Return the sample ids/patterns in a file, one per line, skipping empty lines and comments"""
+    with open(samples_file) as f:
+        return [l.strip() for l in f if l.strip() and not l.startswith('#')]
+
+
+class SampleSelector(object):
+    """Compiled sample selection, an empty selection selects all samples.
+    Selection entries are taken as a glob pattern if they contain '*', '?' or
+    '[', as a regular expression if they start with 're:' and as a sample id
+    otherwise. Patterns and expressions have to match the whole sample id.
+
+    :param list samples: sample ids and patterns to select
+    :param str samples_file: file with more sample ids and patterns, one per line
+    """
+    def __init__(self, samples=None, samples_file=None):
+        entries = list(samples or [])
+        if samples_file:
+            entries.extend(read_samples_file(samples_file))
+        self.ids = set()
+        self.patterns = []
+        for entry in entries:
+            if entry.startswith(REGEX_PREFIX) or GLOB_CHARS.search(entry):
+                self.patterns.append(entry)
+            else:
+                self.ids.add(entry)
+        self._regexes = [re.compile(p[len(REGEX_PREFIX):] if p.startswith(REGEX_PREFIX) else fnmatch.translate(p))
+                         for p in self.patterns]
+        self._matches = {}
+
+    def __bool__(self):
+        return bool(self.ids or self.patterns)
+
+    def __contains__(self, sample):
+        if sample in self.ids:
+            return True
+        if not self._regexes:
+            return False
+        match = self._matches.get(sample)
+        if match is None:
+            match = any(regex.fullmatch(sample) for regex in self._regexes)
+            self._matches[sample] = match
+        return match
+
+    def selects(self, sample):
+        """Return True if the sample is selected, all are if the selection is empty"""
+        return not self or sample in self
+
+    def key(self):
+        """Return the selection in a normalized, JSON serializable form"""
+        return sorted(self.ids) + sorted(self.patterns)
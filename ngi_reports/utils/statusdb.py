@@ -1,20 +1,117 @@
 #!/usr/bin/env python
 
+import bisect
 import couchdb
+import json
 import os
+import re
+import threading
 import yaml
 
+from collections import defaultdict
+from couchdb import http, util
 from datetime import datetime
 
-class statusdb_connection(object):
-    """Main class to make connection to the statusdb, by default looks for config
-    file in home, if not try with provided config
+from ngi_reports.utils import json_extract, profiling
+from ngi_reports.utils.view_snapshot import ViewSnapshot
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_BATCH_SIZE = 50
+
+# flowcell document fields needed for the reports, besides the project's stat rows
+FLOWCELL_FIELDS = ['_id', '_rev', 'RunInfo.Instrument', 'RunInfo.Reads', 'RunParameters.Setup',
+                   'RunParameters.WorkflowType', 'RunParameters.RfidsInfo.FlowCellMode', 'RunParameters.Chemistry',
+                   'RunParameters.FlowCellMode', 'RunParameters.ReagentKitVersion', 'RunParameters.Sbs',
+                   'RunParameters.RTAVersion', 'RunParameters.RtaVersion', 'RunParameters.MCSVersion',
+                   'RunParameters.ApplicationName', 'RunParameters.Application', 'RunParameters.ApplicationVersion',
+                   'DemultiplexConfig', 'lims_data.run_summary']
+
+class CountingConnectionPool(http.ConnectionPool):
+    """HTTP connection pool that keeps at most `max_size` idle keep-alive
+    connections per host and counts how many were opened or reused
+
+    :param timeout: socket timeout in seconds, or None for no timeout
+    :param int max_size: maximum number of idle connections kept per host
+    """
+    def __init__(self, timeout=None, max_size=DEFAULT_POOL_SIZE):
+        super(CountingConnectionPool, self).__init__(timeout)
+        self.max_size = max_size
+        self.opened = 0
+        self.reused = 0
+
+    def get(self, url):
+        scheme, host = util.urlsplit(url, 'http', False)[:2]
+        with self.lock:
+            conns = self.conns.setdefault((scheme, host), [])
+            conn = conns.pop(-1) if conns else None
+            if conn is None:
+                self.opened += 1
+            else:
+                self.reused += 1
+        if conn is None:
+            if scheme == 'http':
+                conn = http.HTTPConnection(host, timeout=self.timeout)
+            elif scheme == 'https':
+                conn = http.HTTPSConnection(host, timeout=self.timeout)
+            else:
+                raise ValueError('{} is not a supported scheme'.format(scheme))
+            conn.connect()
+        return conn
+
+    def release(self, url, conn):
+        scheme, host = util.urlsplit(url, 'http', False)[:2]
+        with self.lock:
+            conns = self.conns.setdefault((scheme, host), [])
+            if len(conns) < self.max_size:
+                conns.append(conn)
+                return
+        conn.close()
+
+class CountingResponseBody(object):
+    """Wrapper of a streamed couchdb response body that counts the bytes read"""
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, size=None):
+        data = self.body.read(size)
+        profiling.PROFILER.count_bytes(len(data))
+        return data
+
+    def iterchunks(self):
+        for chunk in self.body.iterchunks():
+            profiling.PROFILER.count_bytes(len(chunk))
+            yield chunk
+
+    def close(self):
+        self.body.close()
+
+class CountingSession(http.Session):
+    """couchdb session that counts the requests made and the bytes received
+    for the profile of the run
+    """
+    def request(self, method, url, body=None, headers=None, credentials=None, num_redirects=0):
+        if num_redirects:
+            return super(CountingSession, self).request(method, url, body, headers, credentials, num_redirects)
+        try:
+            status, msg, data = super(CountingSession, self).request(method, url, body, headers, credentials)
+        except http.HTTPError:
+            profiling.PROFILER.count_request()
+            raise
+        if isinstance(data, http.ResponseBody):
+            profiling.PROFILER.count_request()
+            data = CountingResponseBody(data)
+        else:
+            profiling.PROFILER.count_request(len(data.getvalue()) if data is not None else 0)
+        return status, msg, data
+
+class ConnectionManager(object):
+    """Process wide holder of the statusdb config and a single pooled couchdb
+    session, shared by all the statusdb connection classes. By default looks
+    for config file in home, if not try with provided config
 
     :param dict config: a dictionary with essential info to make a connection
-    :param logger log: a logger instance to log information when neccesary
     """
-    def __init__(self, config=None, log=None):
-        self.log = log
+    def __init__(self, config=None):
         default_config = os.path.join(os.environ.get("HOME"), ".ngi_config", "statusdb.yaml")
         # if there is no first default config, try to get it from environ
         if not os.path.exists(default_config):
@@ -27,15 +124,155 @@ class statusdb_connection(object):
             if not config:
                 raise SystemExit("Could not find any config info in '~/.ngi_config/statusdb.yaml' or ENV variable 'STATUS_DB_CONFIG'")
 
+        self.config = config
         self.user = config.get("username")
         self.pwrd = config.get("password")
         self.port = config.get("port")
         self.url = config.get("url")
         self.url_string = "http://{}:{}@{}:{}".format(self.user, self.pwrd, self.url, self.port)
         self.display_url_string = "http://{}:{}@{}:{}".format(self.user, "*********", self.url, self.port)
-        self.connection = couchdb.Server(url=self.url_string)
-        if not self.connection:
-            raise SystemExit("Connection failed for url {}, also check the information in config".format(self.display_url_string))
+        self.pool = CountingConnectionPool(max_size=int(config.get("pool_size", DEFAULT_POOL_SIZE)))
+        self.session = CountingSession()
+        self.session.connection_pool = self.pool
+        self.server = couchdb.Server(url=self.url_string, session=self.session)
+
+    def connection_stats(self):
+        """Return the number of HTTP connections opened and reused so far"""
+        return {'opened': self.pool.opened, 'reused': self.pool.reused}
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_connection_manager(config=None):
+    """Return the process wide ConnectionManager, creating it on first use
+
+    :param dict config: config to use if no statusdb config file is found
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager(config)
+        return _manager
+
+def connection_stats():
+    """Return the connection counts of the ConnectionManager, or None if no
+    connection to statusdb was made in this process
+    """
+    return _manager.connection_stats() if _manager else None
+
+class CouchDBBackend(object):
+    """Backend serving the databases of the live statusdb, through the
+    process wide ConnectionManager. Other backends, e.g. to record and replay
+    statusdb data, provide the same `database` method and attributes.
+
+    :param dict config: a dictionary with essential info to make a connection
+    """
+    supports_snapshot = True
+    supports_projection = True
+    supports_streaming = True
+
+    def __init__(self, config=None):
+        manager = get_connection_manager(config)
+        self.server = manager.server
+        if not self.server:
+            raise SystemExit("Connection failed for url {}, also check the information in config".format(manager.display_url_string))
+        self.source = "{}:{}".format(manager.url, manager.port)
+
+    def database(self, dbname):
+        """Return the couchdb database instance for given name"""
+        return self.server[dbname]
+
+class ViewMapping(object):
+    """Dict like access to the key -> doc id (or value) rows of a view. When lazy,
+    only the rows for the requested keys are fetched from statusdb with `key=` or
+    `keys=` and remembered; otherwise the whole view is loaded on first use.
+    Lookups hold a lock, so threads sharing the mapping, e.g. the projects of a
+    batch run, never see a key another thread is still looking up.
+
+    :param db: couchdb database instance the view belongs to
+    :param str view_name: name of the view, e.g. 'project/project_name'
+    :param str field: row attribute to map keys to, either 'id' or 'value'
+    :param bool lazy: query only requested keys instead of the full view
+    :param ViewSnapshot snapshot: local snapshot to load the full view from
+    """
+    def __init__(self, db, view_name, field='id', lazy=True, snapshot=None):
+        self.db = db
+        self.view_name = view_name
+        self.field = field
+        self.lazy = lazy
+        self.snapshot = snapshot
+        self._rows = {}
+        self._complete = False
+        self._lock = threading.RLock()
+        if not lazy:
+            self._load_all()
+
+    def _load_all(self):
+        with self._lock:
+            if not self._complete:
+                with profiling.span('load view {} {}'.format(self.db.name, self.view_name)):
+                    if self.snapshot:
+                        self._rows = {key:(doc_id if self.field == 'id' else value) for doc_id, key, value in self.snapshot.load() if key}
+                    else:
+                        self._rows = {k.key:getattr(k, self.field) for k in self.db.view(self.view_name, reduce=False) if k.key}
+                self._complete = True
+        return self._rows
+
+    def get(self, key, default=None):
+        if not self.lazy or self._complete:
+            return self._load_all().get(key, default)
+        with self._lock:
+            if key not in self._rows:
+                value = None
+                with profiling.span('look up view {} {}'.format(self.db.name, self.view_name)):
+                    for row in self.db.view(self.view_name, key=key, reduce=False):
+                        value = getattr(row, self.field)
+                        break
+                self._rows[key] = value
+            value = self._rows[key]
+        return default if value is None else value
+
+    def get_many(self, keys):
+        """Return a dict of the found rows for given keys, in one request when lazy"""
+        if not self.lazy or self._complete:
+            rows = self._load_all()
+            return {k:rows[k] for k in keys if rows.get(k) is not None}
+        with self._lock:
+            missing = [k for k in keys if k not in self._rows]
+            if missing:
+                found = {}
+                with profiling.span('look up view {} {}'.format(self.db.name, self.view_name)):
+                    for row in self.db.view(self.view_name, keys=missing, reduce=False):
+                        found[row.key] = getattr(row, self.field)
+                # keys missing from the view are remembered as None once the lookup is done
+                self._rows.update({k:found.get(k) for k in missing})
+            return {k:self._rows[k] for k in keys if self._rows.get(k) is not None}
+
+    def keys(self):
+        return self._load_all().keys()
+
+    def items(self):
+        return self._load_all().items()
+
+    def __getitem__(self, key):
+        return self._load_all()[key]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+class statusdb_connection(object):
+    """Main class to make connection to the statusdb, by default the live
+    statusdb through the config and pooled session of the process wide
+    ConnectionManager
+
+    :param dict config: a dictionary with essential info to make a connection
+    :param logger log: a logger instance to log information when neccesary
+    :param backend: backend serving the databases, CouchDBBackend by default
+    """
+    def __init__(self, config=None, log=None, backend=None):
+        self.log = log
+        self.backend = backend or CouchDBBackend(config)
+        self._project_index = None
 
     def get_entry(self, name, use_id_view=False):
         """Retrieve entry from given db for a given name.
@@ -47,11 +284,185 @@ class statusdb_connection(object):
             view = self.id_view
         else:
             view = self.name_view
-        if not view.get(name, None):
+        doc_id = view.get(name, None)
+        if not doc_id:
             if self.log:
                 self.log.warn("no entry '{}' in {}".format(name, self.db))
             return None
-        return self.db.get(view.get(name))
+        return self.db.get(doc_id)
+
+    def get_revs(self, doc_ids):
+        """Return the current revision of the given documents, None for missing or
+        deleted ones, with one request that does not fetch the documents
+
+        :param list doc_ids: ids of the documents
+        """
+        revs = {}
+        for row in self.db.view('_all_docs', keys=list(doc_ids)):
+            value = row.get('value') or {}
+            revs[row.key] = None if value.get('deleted') else value.get('rev')
+        return revs
+
+    def get_entries(self, names, use_id_view=False, batch_size=DEFAULT_BATCH_SIZE, executor=None):
+        """Retrieve entries from given db for the given names in bulk, using one
+        view lookup and `_all_docs?include_docs=true` requests of `batch_size` keys
+
+        :param list names: unique name identifiers (primary key, not the uuid)
+        :param bool use_id_view: look the names up in the id view
+        :param int batch_size: maximum number of documents fetched per request
+        :param executor: optional concurrent.futures executor to fetch the batches on
+        :return: a dict with the found documents keyed by name
+        """
+        if use_id_view:
+            view = self.id_view
+        else:
+            view = self.name_view
+        doc_ids = view.get_many(names)
+        for name in names:
+            if name not in doc_ids and self.log:
+                self.log.warn("no entry '{}' in {}".format(name, self.db))
+
+        names_by_id = defaultdict(list)
+        for name, doc_id in doc_ids.items():
+            names_by_id[doc_id].append(name)
+        ids = list(names_by_id.keys())
+        batch_size = max(int(batch_size), 1)
+        fetch_batch = lambda batch_ids: list(self.db.view('_all_docs', keys=batch_ids, include_docs=True))
+        batches = [ids[i:i+batch_size] for i in range(0, len(ids), batch_size)]
+        entries = {}
+        for rows in (executor.map(fetch_batch, batches) if executor else map(fetch_batch, batches)):
+            for row in rows:
+                if row.doc is None:
+                    continue
+                for name in names_by_id[row.key]:
+                    entries[name] = row.doc
+        return entries
+
+    def get_project_entries(self, project_name, names, batch_size=DEFAULT_BATCH_SIZE, executor=None):
+        """Retrieve flowcell entries for the given run names projected to the run
+        metadata in FLOWCELL_FIELDS and only the Barcode_lane_statistics rows of
+        given project. Uses `_find` with a `fields` list and the design document
+        view `names/project_lane_stats`, keyed on [project, run name] with the
+        project's stat rows as value. Projects are emitted both as they are and
+        with the first run of '_' replaced by '.', e.g.
+
+            function(doc) {
+                var stats = ((doc.illumina || {}).Demultiplex_Stats || {}).Barcode_lane_statistics || [];
+                var rows = {};
+                stats.forEach(function(stat) {
+                    var projects = [stat.Project, String(stat.Project).replace(/_+/, '.')];
+                    if (projects[0] === projects[1]) { projects.pop(); }
+                    projects.forEach(function(p) { (rows[p] = rows[p] || []).push(stat); });
+                });
+                for (var p in rows) { emit([p, <run name as in names/name>], rows[p]); }
+            }
+
+        :param str project_name: NGI project name to get the stat rows of
+        :param list names: run names of the flowcells
+        :param int batch_size: maximum number of documents fetched per request
+        :param executor: optional concurrent.futures executor to fetch the batches on
+        :return: a dict with the projected documents keyed by name, or None if
+                 projection is not available in this database
+        """
+        if not getattr(self.backend, 'supports_projection', False):
+            return None
+        doc_ids = self.name_view.get_many(names)
+        for name in names:
+            if name not in doc_ids and self.log:
+                self.log.warn("no entry '{}' in {}".format(name, self.db))
+        names = [name for name in names if name in doc_ids]
+        batch_size = max(int(batch_size), 1)
+
+        def fetch_batch(batch_names):
+            docs = {doc['_id']:doc for doc in self.db.find({'selector': {'_id': {'$in': [doc_ids[n] for n in batch_names]}},
+                                                             'fields': FLOWCELL_FIELDS, 'limit': len(batch_names)})}
+            stats = defaultdict(list)
+            for row in self.db.view('names/project_lane_stats', keys=[[project_name, n] for n in batch_names], reduce=False):
+                stats[row.key[1]].extend(row.value)
+            entries = {}
+            for name in batch_names:
+                doc = docs.get(doc_ids[name])
+                if doc is not None:
+                    doc['illumina'] = {'Demultiplex_Stats': {'Barcode_lane_statistics': stats[name]}}
+                    entries[name] = doc
+            return entries
+
+        batches = [names[i:i+batch_size] for i in range(0, len(names), batch_size)]
+        entries = {}
+        try:
+            for batch_entries in (executor.map(fetch_batch, batches) if executor else map(fetch_batch, batches)):
+                entries.update(batch_entries)
+        except http.HTTPError as e:
+            if self.log:
+                self.log.warn("Projected fetch is not available in {} ({}), fetching whole documents".format(self.db.name, e))
+            return None
+        return entries
+
+    def stream_project_entries(self, project_name, names, batch_size=DEFAULT_BATCH_SIZE, executor=None):
+        """Retrieve whole flowcell entries for the given run names, but only decode
+        RunInfo, RunParameters, DemultiplexConfig, lims_data.run_summary and the
+        Barcode_lane_statistics rows of given project from the raw `_all_docs`
+        response, instead of building the full document trees
+
+        :param str project_name: NGI project name to keep the stat rows of
+        :param list names: run names of the flowcells
+        :param int batch_size: maximum number of documents fetched per request
+        :param executor: optional concurrent.futures executor to fetch the batches on
+        :return: a dict with the extracted documents keyed by name, or None if
+                 streaming is not available for this database
+        """
+        if not getattr(self.backend, 'supports_streaming', False):
+            return None
+        doc_ids = self.name_view.get_many(names)
+        for name in names:
+            if name not in doc_ids and self.log:
+                self.log.warn("no entry '{}' in {}".format(name, self.db))
+        names_by_id = defaultdict(list)
+        for name, doc_id in doc_ids.items():
+            names_by_id[doc_id].append(name)
+
+        is_project_stat = lambda stat: stat.get('Project') == project_name or re.sub('_+', '.', stat.get('Project', ''), 1) == project_name
+        doc_spec = {'_id': True, '_rev': True, 'RunInfo': True, 'RunParameters': True, 'DemultiplexConfig': True,
+                    'lims_data': {'run_summary': True},
+                    'illumina': {'Demultiplex_Stats': {'Barcode_lane_statistics': is_project_stat}}}
+        response_spec = {'rows': [{'key': True, 'doc': doc_spec}]}
+
+        def fetch_batch(batch_ids):
+            status, headers, body = self.db.resource.post('_all_docs', body=json.dumps({'keys': batch_ids}),
+                                                          headers={'Content-Type': 'application/json'}, include_docs='true')
+            return json_extract.extract(body.read().decode('utf-8'), response_spec).get('rows', [])
+
+        ids = list(names_by_id.keys())
+        batch_size = max(int(batch_size), 1)
+        batches = [ids[i:i+batch_size] for i in range(0, len(ids), batch_size)]
+        entries = {}
+        for rows in (executor.map(fetch_batch, batches) if executor else map(fetch_batch, batches)):
+            for row in rows:
+                if not row.get('doc'):
+                    continue
+                for name in names_by_id[row['key']]:
+                    entries[name] = row['doc']
+        return entries
+
+    def get_project_index(self):
+        """Build once per connection and return the inverted index of `proj_list`,
+        mapping each project id to the parsed dates and the names of its runs,
+        both sorted by date
+        """
+        if self._project_index is None:
+            with profiling.span('index project flowcells {}'.format(self.db.name)):
+                project_runs = defaultdict(list)
+                for pos, (run_name, project_ids) in enumerate(self.proj_list.items()):
+                    run_date = datetime.strptime(run_name.split('_')[0], "%y%m%d")
+                    for project_id in set(project_ids or []):
+                        # same date runs are kept in view order when walked from the latest date
+                        project_runs[project_id].append((run_date, -pos, run_name))
+                project_index = {}
+                for project_id, runs in project_runs.items():
+                    runs.sort()
+                    project_index[project_id] = ([r[0] for r in runs], [r[2] for r in runs])
+            self._project_index = project_index
+        return self._project_index
 
     def get_project_flowcell(self, project_id, open_date="2015-01-01", date_format="%Y-%m-%d"):
         """From information available in flowcell db connection collect the flowcell this project was sequenced
@@ -66,38 +477,64 @@ class statusdb_connection(object):
             open_date = datetime.strptime("2015-01-01", "%Y-%m-%d")
 
         project_flowcells = {}
-        date_sorted_fcs = sorted(list(self.proj_list.keys()), key=lambda k: datetime.strptime(k.split('_')[0], "%y%m%d"), reverse=True)
-        for fc in date_sorted_fcs:
+        run_dates, run_names = self.get_project_index().get(project_id, ([], []))
+        # runs are sorted by date, so only the ones from the open date onwards are looked at
+        for fc in reversed(run_names[bisect.bisect_left(run_dates, open_date):]):
             fc_date, fc_name = fc.split('_')
-            if datetime.strptime(fc_date,'%y%m%d') < open_date:
-                break
-            if project_id in self.proj_list[fc] and fc_name not in project_flowcells.keys():
+            if fc_name not in project_flowcells.keys():
                 project_flowcells[fc_name] = {'name':fc_name,'run_name':fc, 'date':fc_date, 'db':self.db.name}
 
         return project_flowcells
 
 class ProjectSummaryConnection(statusdb_connection):
-    def __init__(self, dbname="projects"):
-        super(ProjectSummaryConnection, self).__init__()
-        self.db = self.connection[dbname]
-        self.name_view = {k.key:k.id for k in self.db.view("project/project_name", reduce=False)}
-        self.id_view = {k.key:k.id for k in self.db.view("project/project_id", reduce=False)}
+    def __init__(self, dbname="projects", lazy=True, backend=None):
+        super(ProjectSummaryConnection, self).__init__(backend=backend)
+        self.db = self.backend.database(dbname)
+        self.name_view = ViewMapping(self.db, "project/project_name", lazy=lazy)
+        self.id_view = ViewMapping(self.db, "project/project_id", lazy=lazy)
 
 class SampleRunMetricsConnection(statusdb_connection):
-    def __init__(self, dbname="samples"):
-        super(SampleRunMetricsConnection, self).__init__()
-        self.db = self.connection[dbname]
+    def __init__(self, dbname="samples", backend=None):
+        super(SampleRunMetricsConnection, self).__init__(backend=backend)
+        self.db = self.backend.database(dbname)
 
 class FlowcellRunMetricsConnection(statusdb_connection):
-    def __init__(self, dbname="flowcells"):
-        super(FlowcellRunMetricsConnection, self).__init__()
-        self.db = self.connection[dbname]
-        self.name_view = {k.key:k.id for k in self.db.view("names/name", reduce=False)}
-        self.proj_list = {k.key:k.value for k in self.db.view("names/project_ids_list", reduce=False) if k.key}
+    def __init__(self, dbname="flowcells", lazy=True, snapshot=False, log=None, backend=None):
+        super(FlowcellRunMetricsConnection, self).__init__(log=log, backend=backend)
+        self.db = self.backend.database(dbname)
+        self.name_view = ViewMapping(self.db, "names/name", lazy=lazy)
+        proj_snapshot = ViewSnapshot(self.db, "names/project_ids_list", self.backend.source, log=log) if snapshot and self.backend.supports_snapshot else None
+        self.proj_list = ViewMapping(self.db, "names/project_ids_list", field='value', lazy=lazy, snapshot=proj_snapshot)
 
 class X_FlowcellRunMetricsConnection(statusdb_connection):
-    def __init__(self, dbname="x_flowcells"):
-        super(X_FlowcellRunMetricsConnection, self).__init__()
-        self.db = self.connection[dbname]
-        self.name_view = {k.key:k.id for k in self.db.view("names/name", reduce=False)}
-        self.proj_list = {k.key:k.value for k in self.db.view("names/project_ids_list", reduce=False) if k.key}
+    def __init__(self, dbname="x_flowcells", lazy=True, snapshot=False, log=None, backend=None):
+        super(X_FlowcellRunMetricsConnection, self).__init__(log=log, backend=backend)
+        self.db = self.backend.database(dbname)
+        self.name_view = ViewMapping(self.db, "names/name", lazy=lazy)
+        proj_snapshot = ViewSnapshot(self.db, "names/project_ids_list", self.backend.source, log=log) if snapshot and self.backend.supports_snapshot else None
+        self.proj_list = ViewMapping(self.db, "names/project_ids_list", field='value', lazy=lazy, snapshot=proj_snapshot)
+
+class ReportConnections(object):
+    """The project and flowcell connections needed to populate a project, made
+    once so they (and their loaded views and indexes) can be shared between
+    several projects, e.g. in batch runs
+
+    :param bool lazy: look up only the needed view keys instead of loading full views
+    :param bool snapshot: keep the flowcell project lists in a local snapshot
+    :param logger log: a logger instance to log information when neccesary
+    :param backend: statusdb backend to get the databases from, live CouchDB by default
+    """
+    def __init__(self, lazy=True, snapshot=True, log=None, backend=None):
+        with profiling.span('connect projects'):
+            self.projects = ProjectSummaryConnection(lazy=lazy, backend=backend)
+        with profiling.span('connect flowcells'):
+            self.flowcells = FlowcellRunMetricsConnection(lazy=lazy, snapshot=snapshot, log=log, backend=backend)
+        with profiling.span('connect x_flowcells'):
+            self.x_flowcells = X_FlowcellRunMetricsConnection(lazy=lazy, snapshot=snapshot, log=log, backend=backend)
+
+    def build_indexes(self):
+        """Build the project indexes of the flowcell connections up front, so
+        projects populated in parallel don't all build them at the same time
+        """
+        for con in (self.flowcells, self.x_flowcells):
+            con.get_project_index()
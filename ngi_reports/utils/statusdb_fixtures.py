@@ -0,0 +1,253 @@
+""" Record statusdb documents and view rows to a local fixture store and
+replay them later, to generate reports without a live statusdb, e.g. for
+repeatable profiling and benchmarking
+"""
+import json
+import os
+import sqlite3
+import threading
+
+from urllib.parse import quote
+
+from ngi_reports.utils import statusdb
+
+
+def collation_key(value):
+    """Sort key of a view key in about the order of CouchDB view collation: null,
+    false, true, numbers, strings, arrays and objects, strings are compared by
+    code point instead of with the ICU collation of CouchDB
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (2,) if value else (1,)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, list):
+        return (5, tuple(collation_key(v) for v in value))
+    return (6, tuple((k, collation_key(v)) for k, v in value.items()))
+
+
+class FixtureRow(dict):
+    """Minimal stand-in for a couchdb view row"""
+    id = property(lambda self: self.get('id'))
+    key = property(lambda self: self['key'])
+    value = property(lambda self: self.get('value'))
+    doc = property(lambda self: self.get('doc'))
+
+
+class DirectoryStore(object):
+    """Fixture store keeping one JSON file per document and per view, under
+    `<path>/<db>/docs/` and `<path>/<db>/views/`
+
+    :param str path: directory to keep the fixtures in
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _file(self, dbname, kind, name):
+        return os.path.join(self.path, dbname, kind, '{}.json'.format(quote(name, safe='')))
+
+    def _read(self, fl, default):
+        if not os.path.exists(fl):
+            return default
+        with open(fl) as f:
+            return json.load(f)
+
+    def _write(self, fl, data):
+        if not os.path.exists(os.path.dirname(fl)):
+            os.makedirs(os.path.dirname(fl))
+        with open(fl, 'w') as f:
+            json.dump(data, f)
+
+    def get_doc(self, dbname, doc_id):
+        return self._read(self._file(dbname, 'docs', doc_id), None)
+
+    def put_doc(self, dbname, doc):
+        with self.lock:
+            self._write(self._file(dbname, 'docs', doc['_id']), doc)
+
+    def get_rows(self, dbname, view_name):
+        return self._read(self._file(dbname, 'views', view_name), [])
+
+    def put_rows(self, dbname, view_name, rows):
+        with self.lock:
+            fl = self._file(dbname, 'views', view_name)
+            stored = {(json.dumps(r['key']), r['id']): r for r in self._read(fl, [])}
+            stored.update({(json.dumps(r['key']), r['id']): r for r in rows})
+            self._write(fl, list(stored.values()))
+
+
+class SQLiteStore(object):
+    """Fixture store keeping all documents and view rows in one SQLite file
+
+    :param str path: path to the SQLite file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS docs (db TEXT, id TEXT, doc TEXT, PRIMARY KEY (db, id))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS view_rows (db TEXT, view TEXT, key TEXT, id TEXT, value TEXT, PRIMARY KEY (db, view, key, id))')
+
+    def get_doc(self, dbname, doc_id):
+        with self.lock:
+            row = self.conn.execute('SELECT doc FROM docs WHERE db=? AND id=?', (dbname, doc_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_doc(self, dbname, doc):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO docs VALUES (?, ?, ?)', (dbname, doc['_id'], json.dumps(doc)))
+
+    def get_rows(self, dbname, view_name):
+        with self.lock:
+            rows = self.conn.execute('SELECT key, id, value FROM view_rows WHERE db=? AND view=?', (dbname, view_name)).fetchall()
+        return [{'key': json.loads(key), 'id': doc_id, 'value': json.loads(value)} for key, doc_id, value in rows]
+
+    def put_rows(self, dbname, view_name, rows):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO view_rows VALUES (?, ?, ?, ?, ?)',
+                                  [(dbname, view_name, json.dumps(r['key']), r['id'], json.dumps(r['value'])) for r in rows])
+
+
+def open_store(path):
+    """Return a SQLite store if the path is (or is to be) a '.sqlite'/'.db' file,
+    a directory store otherwise
+    """
+    if os.path.isfile(path) or path.endswith(('.sqlite', '.db')):
+        return SQLiteStore(path)
+    return DirectoryStore(path)
+
+
+class RecordingDatabase(object):
+    """Wrapper of a live couchdb database that saves every fetched document
+    and view row to a fixture store
+
+    :param db: couchdb database instance to wrap
+    :param store: fixture store to save to
+    """
+    def __init__(self, db, store):
+        self.db = db
+        self.store = store
+        self.name = db.name
+
+    def get(self, doc_id, default=None):
+        doc = self.db.get(doc_id)
+        if doc is None:
+            return default
+        self.store.put_doc(self.name, doc)
+        return doc
+
+    def view(self, view_name, **options):
+        rows = list(self.db.view(view_name, **options))
+        for row in rows:
+            if row.doc is not None:
+                self.store.put_doc(self.name, row.doc)
+        if view_name != '_all_docs':
+            self.store.put_rows(self.name, view_name, [{'key': row.key, 'id': row.id, 'value': row.value} for row in rows])
+        return rows
+
+
+class FixtureDatabase(object):
+    """Database served from a fixture store, supports the document and view
+    lookups the statusdb connections do. The rows of a view are read from the
+    store and sorted once, on first use, the store is not expected to change
+    while replaying.
+
+    :param store: fixture store to serve from
+    :param str dbname: name of the database
+    """
+    def __init__(self, store, dbname):
+        self.store = store
+        self.name = dbname
+        self.lock = threading.Lock()
+        self._views = {}
+
+    def _view_rows(self, view_name):
+        """Return the sorted rows of a view and the rows keyed by their JSON encoded key"""
+        with self.lock:
+            if view_name not in self._views:
+                rows = sorted(self.store.get_rows(self.name, view_name), key=lambda r: (collation_key(r['key']), r['id']))
+                by_key = {}
+                for r in rows:
+                    by_key.setdefault(json.dumps(r['key'], sort_keys=True), []).append(r)
+                self._views[view_name] = (rows, by_key)
+            return self._views[view_name]
+
+    def get(self, doc_id, default=None):
+        doc = self.store.get_doc(self.name, doc_id)
+        return default if doc is None else doc
+
+    def view(self, view_name, key=None, keys=None, include_docs=False, **options):
+        if view_name == '_all_docs':
+            rows = []
+            for doc_id in keys or []:
+                doc = self.get(doc_id)
+                rows.append(FixtureRow(id=doc_id, key=doc_id, value={'rev': doc.get('_rev')}, doc=doc if include_docs else None)
+                            if doc else FixtureRow(key=doc_id, error='not_found'))
+            return rows
+        rows, by_key = self._view_rows(view_name)
+        if key is not None:
+            rows = by_key.get(json.dumps(key, sort_keys=True), [])
+        elif keys is not None:
+            rows = [r for k in keys for r in by_key.get(json.dumps(k, sort_keys=True), [])]
+        rows = [FixtureRow(r) for r in rows]
+        if include_docs:
+            for row in rows:
+                row['doc'] = self.get(row.id)
+        return rows
+
+
+class RecordingBackend(statusdb.CouchDBBackend):
+    """Live statusdb backend that records everything fetched to a fixture store.
+    Projected and streamed fetches are not recorded, whole flowcell documents
+    are fetched instead so the recording can be replayed with any options.
+
+    :param str path: fixture directory or SQLite file to record to
+    :param dict config: a dictionary with essential info to make a connection
+    """
+    supports_snapshot = False
+    supports_projection = False
+    supports_streaming = False
+
+    def __init__(self, path, config=None):
+        super(RecordingBackend, self).__init__(config)
+        self.store = open_store(path)
+
+    def database(self, dbname):
+        return RecordingDatabase(self.server[dbname], self.store)
+
+
+class ReplayBackend(object):
+    """Backend serving recorded statusdb data from a fixture store, without
+    any network access
+
+    :param str path: fixture directory or SQLite file to replay from
+    """
+    supports_snapshot = False
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise SystemExit("Could not find statusdb fixtures in '{}'".format(path))
+        self.store = open_store(path)
+        self.source = 'replay:{}'.format(path)
+
+    def database(self, dbname):
+        return FixtureDatabase(self.store, dbname)
+
+
+def get_backend(record=None, replay=None):
+    """Return the statusdb backend for the given options, None for live statusdb
+
+    :param str record: fixture directory or SQLite file to record statusdb data to
+    :param str replay: fixture directory or SQLite file to replay statusdb data from
+    """
+    if replay:
+        return ReplayBackend(replay)
+    if record:
+        return RecordingBackend(record)
+    return None
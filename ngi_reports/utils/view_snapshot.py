@@ -0,0 +1,127 @@
+""" Persistent local snapshot of statusdb view rows, kept up to date
+incrementally from the database _changes feed
+"""
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_SNAPSHOT_FILE = os.path.join(os.environ.get('HOME', ''), '.ngi_reports', 'statusdb_views.sqlite')
+
+class ViewSnapshot(object):
+    """SQLite snapshot of the rows of one view, stored together with the
+    `update_seq` of the database at the time it was taken. Loading it only
+    applies the changes since that sequence number, the full view is only
+    downloaded on a cold start or when the changes could not be resolved.
+
+    :param db: couchdb database instance the view belongs to
+    :param str view_name: name of the view, e.g. 'names/project_ids_list'
+    :param str source: identifier of the statusdb server, without credentials
+    :param str path: path to the SQLite file, '~/.ngi_reports/statusdb_views.sqlite' by default
+    :param logger log: a logger instance to log information when neccesary
+    """
+    def __init__(self, db, view_name, source, path=None, log=None):
+        self.db = db
+        self.view_name = view_name
+        self.source = '{}/{}'.format(source, db.name)
+        self.path = path or DEFAULT_SNAPSHOT_FILE
+        self.log = log
+
+    def _connect(self):
+        snapshot_dir = os.path.dirname(self.path)
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE IF NOT EXISTS snapshots (source TEXT, view TEXT, update_seq TEXT, PRIMARY KEY (source, view))')
+        conn.execute('CREATE TABLE IF NOT EXISTS rows (source TEXT, view TEXT, doc_id TEXT, key TEXT, value TEXT)')
+        conn.execute('CREATE INDEX IF NOT EXISTS rows_doc_idx ON rows (source, view, doc_id)')
+        return conn
+
+    def load(self):
+        """Bring the snapshot up to date and return its rows as a list of
+        (doc_id, key, value) tuples, the rows are queried from the view
+        instead if the snapshot can not be read or written
+        """
+        try:
+            return self._load()
+        except (OSError, sqlite3.Error) as e:
+            if self.log:
+                self.log.warn('Could not use the view snapshot in {} ({}), querying view {} of {} instead'.format(
+                               self.path, e, self.view_name, self.db.name))
+            return [(row.id, row.key, row.value) for row in self.db.view(self.view_name, reduce=False)]
+
+    def _load(self):
+        start = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                seq = conn.execute('SELECT update_seq FROM snapshots WHERE source=? AND view=?',
+                                   (self.source, self.view_name)).fetchone()
+                num_changes = self._apply_changes(conn, json.loads(seq[0])) if seq else None
+                if num_changes is None:
+                    self._full_refresh(conn)
+            rows = [(doc_id, json.loads(key), json.loads(value)) for doc_id, key, value in
+                    conn.execute('SELECT doc_id, key, value FROM rows WHERE source=? AND view=? ORDER BY key, doc_id', (self.source, self.view_name))]
+        finally:
+            conn.close()
+        if self.log:
+            if num_changes is None:
+                self.log.info('Cold start for view {} of {}: downloaded {} rows in {:.2f}s'.format(
+                               self.view_name, self.db.name, len(rows), time.time() - start))
+            else:
+                self.log.info('Warm start for view {} of {}: applied {} changes to {} rows in {:.2f}s'.format(
+                               self.view_name, self.db.name, num_changes, len(rows), time.time() - start))
+        return rows
+
+    def _store_rows(self, conn, rows):
+        conn.executemany('INSERT INTO rows VALUES (?, ?, ?, ?, ?)',
+                         [(self.source, self.view_name, row.id, json.dumps(row.key), json.dumps(row.value)) for row in rows])
+
+    def _set_seq(self, conn, update_seq):
+        conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)', (self.source, self.view_name, json.dumps(update_seq)))
+
+    def _full_refresh(self, conn):
+        # take the sequence number first, changes made while downloading are re-applied next time
+        update_seq = self.db.info()['update_seq']
+        conn.execute('DELETE FROM rows WHERE source=? AND view=?', (self.source, self.view_name))
+        self._store_rows(conn, self.db.view(self.view_name, reduce=False))
+        self._set_seq(conn, update_seq)
+
+    def _apply_changes(self, conn, since):
+        """Apply the changes since the stored sequence number, returns the number
+        of changed documents or None if a full refresh is needed instead
+        """
+        # not filtered on the view, as deleted documents are never reported by the `_view` filter
+        changes = self.db.changes(since=since)
+        changed = {}
+        for change in changes.get('results', []):
+            if not change['id'].startswith('_design/'):
+                changed[change['id']] = change.get('deleted', False)
+        if not changed:
+            self._set_seq(conn, changes.get('last_seq', since))
+            return 0
+
+        old_keys = {}
+        for doc_id in changed:
+            for (key,) in conn.execute('SELECT key FROM rows WHERE source=? AND view=? AND doc_id=?', (self.source, self.view_name, doc_id)):
+                old_keys[doc_id] = json.loads(key)
+            conn.execute('DELETE FROM rows WHERE source=? AND view=? AND doc_id=?', (self.source, self.view_name, doc_id))
+
+        updated = [doc_id for doc_id, deleted in changed.items() if not deleted]
+        known_keys = [old_keys[doc_id] for doc_id in updated if doc_id in old_keys]
+        new_rows = [row for row in self.db.view(self.view_name, keys=known_keys, reduce=False) if row.id in changed] if known_keys else []
+        unresolved = set(updated) - {row.id for row in new_rows}
+        if unresolved:
+            # new documents, run names start with the date so look from the newest known date onwards
+            newest = conn.execute('SELECT MAX(key) FROM rows WHERE source=? AND view=? AND key LIKE ?', (self.source, self.view_name, '"%')).fetchone()[0]
+            if newest is None:
+                return None
+            recent_rows = [row for row in self.db.view(self.view_name, startkey=json.loads(newest)[:6], reduce=False) if row.id in unresolved]
+            unresolved -= {row.id for row in recent_rows}
+            if unresolved:
+                return None
+            new_rows.extend(recent_rows)
+
+        self._store_rows(conn, new_rows)
+        self._set_seq(conn, changes.get('last_seq', since))
+        return len(changed)
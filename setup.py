@@ -23,6 +23,7 @@ setup(
     packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
     include_package_data=True,
     zip_safe=False,
-    entry_points={"console_scripts": ["ngi_reports=ngi_reports.ngi_reports:main"]},
+    entry_points={"console_scripts": ["ngi_reports=ngi_reports.ngi_reports:main",
+                                    "ngi_reports_batch=ngi_reports.batch:main"]},
     install_requires=install_requires
 )
@@ -0,0 +1,6 @@
+""" Lets the tests import ngi_reports and the benchmarks from the repository root
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir)))
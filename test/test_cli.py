@@ -0,0 +1,35 @@
+""" Tests of the command line of ngi_reports
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+MARKDOWN = 'title: Test report\nsubtitle: A.Test_20_01\n\n# Project Information\n\nSome text\n'
+
+
+def run_cli(args, cwd):
+    env = dict(os.environ, HOME=str(cwd), PYTHONPATH=REPO_DIR)
+    return subprocess.run([sys.executable, '-m', 'ngi_reports.ngi_reports'] + args, cwd=str(cwd), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+@pytest.mark.parametrize('args', [['-md', 'report.md', 'project_summary'],
+                                  ['project_summary', '-md', 'report.md'],
+                                  ['project_summary', '--markdown_file', 'report.md']])
+def test_regenerate_html_in_any_order(tmp_path, args):
+    (tmp_path / 'report.md').write_text(MARKDOWN)
+    proc = run_cli(args, tmp_path)
+    assert proc.returncode == 0, proc.stderr
+    assert 'Some text' in (tmp_path / 'report.html').read_text()
+
+
+def test_regenerate_html_of_several_files_and_patterns(tmp_path):
+    for name in ('first.md', 'second.md', 'third.md'):
+        (tmp_path / name).write_text(MARKDOWN)
+    proc = run_cli(['-md', 'first.md', '-md', 's*.md', 'project_summary'], tmp_path)
+    assert proc.returncode == 0, proc.stderr
+    assert (tmp_path / 'first.html').exists() and (tmp_path / 'second.html').exists()
+    assert not (tmp_path / 'third.html').exists()
@@ -0,0 +1,22 @@
+""" Tests of parsing the flowcell documents of a project
+"""
+import logging
+
+from benchmarks import synthetic
+from ngi_reports.utils import statusdb, statusdb_fixtures
+from ngi_reports.utils.entities import Project
+
+ORGANISM_NAMES = {'hg38': 'Homo sapiens'}
+
+
+def test_flowcell_without_demultiplex_config_is_skipped(tmp_path):
+    path = str(tmp_path / 'statusdb.sqlite')
+    dbs = synthetic.synthetic_statusdb(4, flowcells=3, lanes=2)
+    del dbs['x_flowcells'][1]['DemultiplexConfig']
+    synthetic.write_fixtures(dbs, path)
+
+    proj = Project()
+    proj.populate(logging.getLogger('test'), ORGANISM_NAMES, project=synthetic.PROJECT_ID, no_project_cache=True, exclude_fc=[],
+                  statusdb_connections=statusdb.ReportConnections(snapshot=False, backend=statusdb_fixtures.ReplayBackend(path)))
+    assert sorted(proj.flowcells) == ['H0000BCXX', 'H0002BCXX']
+    assert all(fc.casava for fc in proj.flowcells.values())
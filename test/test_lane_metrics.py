@@ -0,0 +1,16 @@
+""" Tests of the lane metrics of the reports
+"""
+import numpy as np
+import pytest
+
+from ngi_reports.utils.lane_metrics import format_metric
+
+
+@pytest.mark.parametrize('value', [0.0, 0.125, 0.135, 0.285, 1.005, 2.675, 93.125, 1234.565, -0.005])
+def test_format_metric_rounds_as_numpy(value):
+    assert format_metric(value) == '{:.2f}'.format(np.round(value, 2))
+
+
+def test_format_metric_leaves_other_values():
+    assert format_metric(None) is None
+    assert format_metric('1.5') == '1.5'
@@ -0,0 +1,23 @@
+""" Tests of the profiling spans of a report run
+"""
+import importlib
+import sys
+
+from ngi_reports.utils import profiling
+
+
+def test_spans_without_the_resource_module(monkeypatch):
+    # as on Windows, where there is no resource module
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    module = importlib.reload(profiling)
+    try:
+        profiler = module.Profiler()
+        profiler.enable()
+        with profiler.span('populate'):
+            pass
+        assert module.peak_rss_mb() is None
+        assert profiler.breakdown()[0]['process_peak_rss_mb_so_far'] is None
+        assert profiler.table().splitlines()[1].split()[-1] == '-'
+    finally:
+        monkeypatch.undo()
+        importlib.reload(profiling)
@@ -0,0 +1,72 @@
+""" Tests of the local cache of populated projects
+"""
+import gzip
+import logging
+import os
+
+from ngi_reports.utils import project_cache
+
+
+class Backend(object):
+    source = 'replay:test'
+
+
+class Database(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class Connection(object):
+    def __init__(self, dbname):
+        self.backend = Backend()
+        self.db = Database(dbname)
+
+
+class Connections(object):
+    """Stand-in for ReportConnections, only the parts used to make the cache key and save"""
+    def __init__(self):
+        self.projects = Connection('projects')
+        self.flowcells = Connection('flowcells')
+        self.x_flowcells = Connection('x_flowcells')
+
+
+def save(cache, caplog):
+    with caplog.at_level(logging.WARNING):
+        cache.save({'ngi_id': 'P1000', 'dates': {'open_date': '2020-01-01'}}, {'_id': 'project_P1000', '_rev': '1-a'}, {}, {})
+
+
+def test_save_to_unusable_directory_is_skipped(tmp_path, caplog):
+    # a file where the cache directory should be, e.g. a broken ~/.ngi_reports
+    not_a_dir = tmp_path / '.ngi_reports'
+    not_a_dir.write_text('')
+    cache = project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(not_a_dir / 'project_cache'),
+                                       log=logging.getLogger('test'))
+    save(cache, caplog)
+    assert 'Could not cache project P1000' in caplog.text
+    assert not_a_dir.read_text() == ''
+
+
+def test_save_leaves_no_temporary_files(tmp_path, caplog):
+    cache_dir = tmp_path / 'project_cache'
+    cache = project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(cache_dir), log=logging.getLogger('test'))
+    save(cache, caplog)
+    assert os.listdir(str(cache_dir)) == [os.path.basename(cache.path)]
+
+
+def test_key_depends_on_format_and_sources(tmp_path, monkeypatch):
+    path = project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(tmp_path)).path
+    monkeypatch.setattr(project_cache, 'CACHE_FORMAT', project_cache.CACHE_FORMAT + 1)
+    assert project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(tmp_path)).path != path
+    monkeypatch.undo()
+    monkeypatch.setattr(project_cache, 'source_hash', lambda: 'changed parser code')
+    assert project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(tmp_path)).path != path
+
+
+def test_entry_pickled_by_older_code_is_a_miss(tmp_path, caplog):
+    cache = project_cache.ProjectCache(Connections(), 'P1000', {}, path=str(tmp_path), log=logging.getLogger('test'))
+    # a pickle of a class from a module that no longer exists
+    with gzip.open(cache.path, 'wb') as f:
+        f.write(b'cngi_reports.utils.removed_module\nProject\n)R.')
+    with caplog.at_level(logging.WARNING):
+        assert cache.load() is None
+    assert 'Could not read the cached project P1000' in caplog.text
@@ -0,0 +1,50 @@
+""" Tests that the command line entry points only import what they need to list
+their options, within the import time budget of benchmarks/startup.py, the
+modules to make reports are imported when a report is made
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import startup
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+# modules only needed to make or render reports
+HEAVY_MODULES = ('jinja2', 'markdown', 'couchdb', 'yaml', 'ngi_reports.reports')
+
+SCRIPT = '''
+import json, sys
+import {module}
+try:
+    {module}.main()
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+'''
+
+
+def imported_modules(module, args):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    proc = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module)] + args, cwd=REPO_DIR, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return json.loads(proc.stderr.splitlines()[-1])
+
+
+@pytest.mark.parametrize('module,args', [('ngi_reports.ngi_reports', []),
+                                         ('ngi_reports.ngi_reports', ['--help']),
+                                         ('ngi_reports.ngi_reports', ['--version']),
+                                         ('ngi_reports.batch', ['--help'])])
+def test_listing_options_imports_no_heavy_modules(module, args):
+    heavy = [m for m in imported_modules(module, args) if any(m == h or m.startswith(h + '.') for h in HEAVY_MODULES)]
+    assert heavy == []
+
+
+@pytest.mark.parametrize('command', sorted(startup.COMMANDS))
+def test_import_time_within_budget(command):
+    # the best of several runs, so a busy machine does not fail the test
+    runs = [startup.import_times(startup.COMMANDS[command]) for _ in range(3)]
+    total_ms = min(sum(top_level.values()) for top_level, modules in runs) / 1000.0
+    assert total_ms <= startup.BUDGET_MS, '{} imports in {:.1f} ms'.format(command, total_ms)
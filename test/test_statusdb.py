@@ -0,0 +1,86 @@
+""" Tests of the statusdb view lookups shared between the threads of a batch run
+"""
+import logging
+import threading
+import time
+
+from benchmarks import synthetic
+from ngi_reports.utils import statusdb, statusdb_fixtures
+from ngi_reports.utils.entities import Project
+
+ORGANISM_NAMES = {'hg38': 'Homo sapiens'}
+
+
+class SlowDatabase(object):
+    """Fixture database whose view queries take a while, so lookups of
+    concurrent threads overlap
+    """
+    def __init__(self, db, delay=0.05):
+        self.db = db
+        self.name = db.name
+        self.delay = delay
+
+    def get(self, doc_id, default=None):
+        return self.db.get(doc_id, default)
+
+    def view(self, view_name, **options):
+        time.sleep(self.delay)
+        return self.db.view(view_name, **options)
+
+
+class SlowReplayBackend(statusdb_fixtures.ReplayBackend):
+    def database(self, dbname):
+        return SlowDatabase(super(SlowReplayBackend, self).database(dbname))
+
+
+def run_threads(func, args_list):
+    """Call func with each of the args on its own thread, all started at the same time"""
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+    def run(i, args):
+        barrier.wait()
+        results[i] = func(*args)
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def write_shared_fixtures(path):
+    """Write two projects sequenced on the same flowcells to a fixture store"""
+    dbs = synthetic.synthetic_statusdb(4, flowcells=3, lanes=2, instruments=('NovaSeq6000',), other_projects=1)
+    dbs['projects'].append(synthetic.project_document(4, project_id='P2000', project_name='B.Other_0'))
+    synthetic.write_fixtures(dbs, path)
+
+
+def test_lazy_view_lookups_of_concurrent_threads(tmp_path):
+    path = str(tmp_path / 'statusdb.sqlite')
+    write_shared_fixtures(path)
+    db = SlowReplayBackend(path).database('x_flowcells')
+    view = statusdb.ViewMapping(db, 'names/name', lazy=True)
+    run_name = db.view('names/name')[0].key
+
+    results = run_threads(lambda: (view.get_many([run_name]), view.get(run_name)), [()] * 4)
+    for found, doc_id in results:
+        assert found == {run_name: doc_id}
+        assert doc_id is not None
+
+
+def test_projects_on_threads_keep_shared_flowcells(tmp_path):
+    path = str(tmp_path / 'statusdb.sqlite')
+    write_shared_fixtures(path)
+    connections = statusdb.ReportConnections(lazy=True, snapshot=False, backend=SlowReplayBackend(path))
+    connections.build_indexes()
+    log = logging.getLogger('test')
+
+    def populate(project):
+        proj = Project()
+        proj.populate(log, ORGANISM_NAMES, project=project, statusdb_connections=connections,
+                      no_project_cache=True, exclude_fc=[])
+        return proj
+
+    for proj in run_threads(populate, [(synthetic.PROJECT_ID,), ('P2000',)]):
+        assert len(proj.flowcells) == 3
+        assert all(fc.lane_rows() for fc in proj.flowcells.values())
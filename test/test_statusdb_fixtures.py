@@ -0,0 +1,57 @@
+""" Tests of recording statusdb data to a fixture store and replaying it
+"""
+import logging
+
+import pytest
+
+from benchmarks import synthetic
+from ngi_reports.utils import statusdb, statusdb_fixtures
+from ngi_reports.utils.entities import Project
+
+ORGANISM_NAMES = {'hg38': 'Homo sapiens'}
+
+
+def recording_backend(source_path, record_path):
+    """Return a recording backend with the fixtures in source_path standing in
+    for the live statusdb, without connecting to it
+    """
+    source = statusdb_fixtures.ReplayBackend(source_path)
+    backend = statusdb_fixtures.RecordingBackend.__new__(statusdb_fixtures.RecordingBackend)
+    backend.server = {dbname: source.database(dbname) for dbname in ('projects', 'flowcells', 'x_flowcells')}
+    backend.source = source.source
+    backend.store = statusdb_fixtures.open_store(record_path)
+    return backend
+
+
+def populate(backend, **options):
+    proj = Project()
+    proj.populate(logging.getLogger('test'), ORGANISM_NAMES, project=synthetic.PROJECT_ID, no_project_cache=True, exclude_fc=[],
+                  statusdb_connections=statusdb.ReportConnections(snapshot=False, backend=backend), **options)
+    return proj
+
+
+def lane_rows(proj):
+    return sorted((name, sorted(str(sorted(l.items())) for l in fc.lane_rows())) for name, fc in proj.flowcells.items())
+
+
+@pytest.mark.parametrize('options', [['projected_fetch'], ['stream_fc_docs'], ['projected_fetch', 'stream_fc_docs']])
+def test_record_with_fetch_options_and_replay(tmp_path, options):
+    source_path = str(tmp_path / 'source.sqlite')
+    record_path = str(tmp_path / 'recorded.sqlite')
+    synthetic.write_fixtures(synthetic.synthetic_statusdb(6, flowcells=4, lanes=2, instruments=('NovaSeq6000', 'HiSeq2500')), source_path)
+
+    recorded = populate(recording_backend(source_path, record_path), **{option: True for option in options})
+    replayed = populate(statusdb_fixtures.ReplayBackend(record_path), **{option: True for option in options})
+    assert len(recorded.flowcells) == 4
+    assert lane_rows(replayed) == lane_rows(recorded)
+    assert sorted(replayed.samples) == sorted(recorded.samples)
+
+
+def test_replayed_views_are_in_collation_order(tmp_path):
+    store = statusdb_fixtures.open_store(str(tmp_path / 'fixtures.sqlite'))
+    keys = [None, False, True, 2, 10, 'a', 'b', ['a', 1], ['a', 'b'], {'a': 1}]
+    store.put_rows('projects', 'test/keys', [{'key': key, 'id': 'doc_{}'.format(i), 'value': i} for i, key in enumerate(reversed(keys))])
+    db = statusdb_fixtures.FixtureDatabase(store, 'projects')
+    assert [row.key for row in db.view('test/keys')] == keys
+    assert [row.key for row in db.view('test/keys', keys=[10, ['a', 1], 'c'])] == [10, ['a', 1]]
+    assert [row.value for row in db.view('test/keys', key='b')] == [3]
@@ -0,0 +1,65 @@
+""" Tests of the local snapshot of statusdb view rows
+"""
+import collections
+import logging
+
+from ngi_reports.utils.view_snapshot import ViewSnapshot
+
+Row = collections.namedtuple('Row', ['id', 'key', 'value'])
+
+
+class Database(object):
+    """Stand-in for a couchdb database with one view mapping run names to project lists"""
+    name = 'flowcells'
+
+    def __init__(self, docs):
+        self.docs = dict(docs)
+        self.log = []
+
+    def save(self, doc_id, run_name, projects):
+        self.docs[doc_id] = (run_name, projects)
+        self.log.append((doc_id, False))
+
+    def delete(self, doc_id):
+        del self.docs[doc_id]
+        self.log.append((doc_id, True))
+
+    def info(self):
+        return {'update_seq': len(self.log)}
+
+    def changes(self, since=0, filter=None, **kwargs):
+        # like couchdb, the `_view` filter only reports documents the view emits rows for
+        latest = {doc_id: deleted for doc_id, deleted in self.log[since:]}
+        results = [dict({'id': doc_id}, **({'deleted': True} if deleted else {})) for doc_id, deleted in latest.items()
+                   if not (filter == '_view' and deleted)]
+        return {'results': results, 'last_seq': len(self.log)}
+
+    def view(self, view_name, keys=None, startkey=None, reduce=True):
+        rows = sorted(Row(doc_id, run_name, projects) for doc_id, (run_name, projects) in self.docs.items())
+        return [row for row in rows if (keys is None or row.key in keys) and (startkey is None or row.key >= startkey)]
+
+
+def snapshot_rows(db, path):
+    return ViewSnapshot(db, 'names/project_ids_list', 'http://statusdb', path=path).load()
+
+
+def test_changes_are_applied_to_the_snapshot(tmp_path):
+    path = str(tmp_path / 'statusdb_views.sqlite')
+    db = Database({'fc1': ('200101_A00001_0001_AH1', ['P1000']), 'fc2': ('200102_A00001_0002_AH2', ['P2000'])})
+    assert snapshot_rows(db, path) == db.view('names/project_ids_list')
+    db.save('fc2', '200102_A00001_0002_AH2', ['P2000', 'P1000'])
+    db.save('fc3', '200103_A00001_0003_AH3', ['P1000'])
+    db.delete('fc1')
+    assert snapshot_rows(db, path) == db.view('names/project_ids_list')
+
+
+def test_unusable_snapshot_directory_queries_the_view(tmp_path, caplog):
+    # a file where the snapshot directory should be, e.g. a broken ~/.ngi_reports
+    not_a_dir = tmp_path / '.ngi_reports'
+    not_a_dir.write_text('')
+    db = Database({'fc1': ('200101_A00001_0001_AH1', ['P1000'])})
+    snapshot = ViewSnapshot(db, 'names/project_ids_list', 'http://statusdb', path=str(not_a_dir / 'statusdb_views.sqlite'),
+                            log=logging.getLogger('test'))
+    with caplog.at_level(logging.WARNING):
+        assert snapshot.load() == db.view('names/project_ids_list')
+    assert 'Could not use the view snapshot' in caplog.text